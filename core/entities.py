@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Protocol
+from typing import Optional, Protocol
 
 class Tool(Protocol):
     name: str
@@ -14,7 +14,7 @@ class LLMResponse:
     tool_calls: list[dict]
 
 class ToolRepository(Protocol):
-    async def get_tool(self, name: str) -> Tool:
+    async def get_tool(self, name: str, access_token: Optional[str] = None) -> Tool:
         ...
     
     async def get_all_tools(self) -> list[Tool]:
@@ -25,6 +25,8 @@ class LLMService(Protocol):
         ...
     async def process_single_tool(self, query: str, tool_name: str, args: dict, context:dict) -> LLMResponse:
         ...
+    async def resolve_arguments(self, query: str, steps: list[dict], context: list) -> list[dict]:
+        ...
     async def summary(self, query: str, context:list) -> str:
         ...
     
\ No newline at end of file
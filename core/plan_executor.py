@@ -0,0 +1,100 @@
+import asyncio
+import re
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from .entities import LLMService
+
+PLACEHOLDER = re.compile(r"\$result:(\d+)")
+
+
+@dataclass
+class PlanStep:
+    index: int
+    name: str
+    args: dict
+    depends_on: set[int] = field(default_factory=set)
+    result: Optional[dict] = None
+
+
+def find_dependencies(value, index: int) -> set[int]:
+    if isinstance(value, str):
+        # only earlier steps can be referenced, anything else would never resolve
+        return {int(ref) for ref in PLACEHOLDER.findall(value) if 0 < int(ref) < index}
+    if isinstance(value, dict):
+        return set().union(*(find_dependencies(item, index) for item in value.values()))
+    if isinstance(value, list):
+        return set().union(*(find_dependencies(item, index) for item in value))
+    return set()
+
+
+class PlanExecutor:
+    def __init__(
+        self,
+        llm_service: LLMService,
+        run_tool: Callable[[str, dict], Awaitable[dict]],
+        concurrent_tools: frozenset = frozenset()
+    ):
+        self.llm_service = llm_service
+        self.run_tool = run_tool
+        self.concurrent_tools = concurrent_tools
+
+    async def run(self, query: str, tool_calls: list[dict]) -> list[PlanStep]:
+        steps = [
+            PlanStep(index=i, name=call["name"], args=call["args"], depends_on=find_dependencies(call["args"], i))
+            for i, call in enumerate(tool_calls, start=1)
+        ]
+        by_index = {step.index: step for step in steps}
+
+        position = 0
+        done: set[int] = set()
+        resolved: set[int] = set()
+        while position < len(steps):
+            batch = self._next_batch(steps, position)
+
+            # every pending step whose dependencies have all run gets its arguments in one LLM call,
+            # including later steps, so mutations sharing a dependency level are resolved together
+            ready = [
+                step for step in steps[position:]
+                if step.depends_on and step.index not in resolved and step.depends_on <= done
+            ]
+            if ready:
+                await self._resolve(query, ready, by_index)
+                resolved.update(step.index for step in ready)
+
+            await self._execute(batch)
+            done.update(step.index for step in batch)
+            position += len(batch)
+
+        return steps
+
+    def _next_batch(self, steps: list[PlanStep], position: int) -> list[PlanStep]:
+        # steps keep the planned order: only adjacent read-only steps that don't depend on each
+        # other run side by side, a mutation always runs alone after everything planned before it
+        batch = [steps[position]]
+        if batch[0].name not in self.concurrent_tools:
+            return batch
+        for step in steps[position + 1:]:
+            if step.name not in self.concurrent_tools or step.depends_on & {member.index for member in batch}:
+                break
+            batch.append(step)
+        return batch
+
+    async def _resolve(self, query: str, unresolved: list[PlanStep], by_index: dict[int, PlanStep]):
+        needed = sorted(set().union(*(step.depends_on for step in unresolved)))
+        context = [
+            {"tool": f"step {index} ({by_index[index].name})", "data": (by_index[index].result or {}).get("data")}
+            for index in needed
+        ]
+        resolved = await self.llm_service.resolve_arguments(
+            query=query,
+            steps=[{"step": step.index, "name": step.name, "args": step.args} for step in unresolved],
+            context=context
+        )
+        for step, args in zip(unresolved, resolved):
+            step.args = args
+
+    async def _execute(self, batch: list[PlanStep]):
+        results = await asyncio.gather(*(self.run_tool(step.name, step.args) for step in batch))
+        for step, result in zip(batch, results):
+            step.result = result
@@ -1,35 +1,65 @@
+import asyncio
+import time
+from contextlib import nullcontext
+from typing import AsyncIterator, Optional
 from .entities import ToolRepository, LLMService
+from .plan_executor import PlanExecutor
+
+READ_ONLY_TOOLS = frozenset({"list_google_calendar_events", "list_notes", "list_folders", "get_note"})
+ERROR_PREFIXES = ("LLM API error:", "Error:")
+
+def is_failed(result) -> bool:
+    # the LLM service and the tools report failures as text instead of raising
+    if isinstance(result, str):
+        return result.startswith(ERROR_PREFIXES)
+    return isinstance(result, dict) and bool(result.get("errors"))
 
 class ProcessQueryUseCase:
-    def __init__(self, llm_service: LLMService, tool_repo: ToolRepository):
+    def __init__(self, llm_service: LLMService, tool_repo: ToolRepository, prefetch: bool = False, recorder=None):
         self.llm_service = llm_service
         self.tool_repo = tool_repo
+        self.prefetch = prefetch
+        self.recorder = recorder
     
     async def execute(self, query: str, access_token: str, files: list[dict] = None) -> dict:
-        if access_token and hasattr(self.tool_repo, 'set_access_token'):
-            self.tool_repo.set_access_token(access_token)
+        if not self.recorder:
+            return await self.run(query, access_token, files)
+
+        started = time.monotonic()
+        try:
+            return await self.run(query, access_token, files)
+        finally:
+            self.recorder.record_query(query, access_token, files, started, time.monotonic() - started)
+
+    async def run(self, query: str, access_token: str, files: list[dict] = None) -> dict:
+        if self.prefetch and access_token and hasattr(self.tool_repo, 'prefetch'):
+            self.tool_repo.prefetch(query, access_token=access_token)
 
         response = await self.llm_service.process_query(query)
 
         if not response.tool_calls:
             return response.content
 
-        results = []
-        for tool_call in response.tool_calls:
-            tool_name = tool_call["name"]
-            args = tool_call["args"]
-
+        async def run_tool(tool_name: str, args: dict) -> dict:
             if tool_name == "create_note" and files:
-                args["files"] = files
+                args = {**args, "files": files}
+            return await self.execute_tool(tool_name=tool_name, args=args, access_token=access_token)
 
-            actual_result = await self.execute_tool(tool_name=tool_name, args=args)
-            
-            data = actual_result.get("data")
-            file_blobs = actual_result.get("files", [])
-            all_files = []
+        executor = PlanExecutor(self.llm_service, run_tool, concurrent_tools=READ_ONLY_TOOLS)
+        steps = await executor.run(query, response.tool_calls)
 
+        results = []
+        all_files = []
+        errors = []
+        for step in steps:
+            data = step.result.get("data")
+            file_blobs = step.result.get("files", [])
+
+            if isinstance(data, str) and data.startswith("Failed to"):
+                errors.append(data)
             if data:
-                results.append(f"response from {tool_name}: {data}")
+                # keep the raw tool payload, the LLM service decides how to encode it into the prompt
+                results.append({"tool": step.name, "data": data})
 
             if file_blobs:
                 all_files.extend(file_blobs)
@@ -38,9 +68,37 @@ class ProcessQueryUseCase:
 
         return {
             "summary": end_result,
-            "files": all_files if all_files else None
+            "files": all_files if all_files else None,
+            "errors": errors if errors else None
         }
 
-    async def execute_tool(self, tool_name: str, args: dict) -> dict:
-        tool = await self.tool_repo.get_tool(tool_name)
+    async def execute_batch(
+        self, queries: list[str], access_token: str, concurrency: int = 4
+    ) -> AsyncIterator[tuple[int, Optional[dict], Optional[str]]]:
+        # queries of one batch share the user's list cache and the pooled backend connections,
+        # results are yielded as (index, result, error) in completion order; closing the generator
+        # early cancels the queries still pending
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(index: int, query: str):
+            async with semaphore:
+                try:
+                    return index, await self.execute(query, access_token=access_token), None
+                except Exception as e:
+                    return index, None, str(e)
+
+        # the tasks keep the tool repository's batch scope, so they share the user's lists
+        scope = self.tool_repo.batch_scope() if hasattr(self.tool_repo, 'batch_scope') else nullcontext()
+        with scope:
+            tasks = [asyncio.create_task(run(i, query)) for i, query in enumerate(queries)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def execute_tool(self, tool_name: str, args: dict, access_token: Optional[str] = None) -> dict:
+        tool = await self.tool_repo.get_tool(tool_name, access_token=access_token)
         return await tool.execute(**args)
\ No newline at end of file
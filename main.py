@@ -1,72 +1,422 @@
 import aiohttp_cors
 import anyio
+import asyncio
+import importlib.util
 import os
 import json
 import logging
+import uuid
+from contextlib import AsyncExitStack, aclosing
 
+from services.api.admin import is_admin
+from services.api.admission import AdmissionController, AdmissionRejected
+from services.api.compression import ResponseCompressor
+from services.api.idempotency import IdempotencyKeyReused, QueryDeduplicator
+from services.api.jobs import JobManager
+from services.api.json_codec import dumps, dumps_bytes, json_response, loads
+from services.api.logs import parse_sample_rates, request_id, setup_logging
+from services.api.loop_monitor import LoopLagMonitor
+from services.api.memory import MemoryAccounting, count_payload
+from services.api.profiler import RequestProfiler
+from services.api.warmup import Warmup, preload
+from services.mcp.attachment_store import AttachmentStore
+from services.mcp.backend import BackendSessions
 from services.mcp.mcp_service import MCPService
+from services.llm.context_builder import ContextBuilder
+from services.llm.endpoint_pool import EndpointPool
 from services.llm.llm_service import LLMClient
-from core.use_cases import ProcessQueryUseCase
+from services.llm.model_router import ModelRouter, StageModels
+from services.llm.rate_limiter import LLMRateLimiter, RateLimitExceeded
+from services.replay.traffic import TrafficRecorder, open_traffic
+from core.use_cases import ProcessQueryUseCase, is_failed
 from aiohttp import web
 from dotenv import load_dotenv
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@web.middleware
+async def request_context(request: web.Request, handler):
+    # every log line of the request (use case, tools, LLM calls) carries this id
+    rid = request.headers.get("X-Request-Id") or uuid.uuid4().hex
+    token = request_id.set(rid)
+    try:
+        response = await handler(request)
+        if not response.prepared:
+            response.headers["X-Request-Id"] = rid
+        return response
+    finally:
+        request_id.reset(token)
+
 async def handle_query_request(request: web.Request) -> web.Response:
     try:
         auth_header = request.headers.get("Authorization")
         if not auth_header or not auth_header.startswith("Bearer "):
-            return web.json_response({"error": "Missing or invalid Authorization header"}, status=401)
+            return json_response({"error": "Missing or invalid Authorization header"}, status=401)
         access_token = auth_header.split("Bearer ")[1]
 
-        content_type = request.content_type
+        profiler = request.app["profiler"]
+        profile_mode = profiler.requested_mode(request, admin=is_admin(request))
 
-        if content_type.startswith("application/json"):
-            data = await request.json()
-            query = data.get("query")
-            files = None
+        # admit before reading the body so queued requests don't hold uploads in memory
+        async with request.app["admission"].admit(access_token):
+            async with request.app["memory"].track("/query"):
+                if profile_mode is None:
+                    return await process_query_request(request, access_token)
 
-        elif content_type.startswith("multipart/form-data"):
-            reader = await request.multipart()
+                async with profiler.profile(profile_mode) as profile_id:
+                    response = await process_query_request(request, access_token)
+                response.headers["X-Profile-Id"] = profile_id
+                return response
+    except AdmissionRejected as e:
+        return json_response(
+            {"error": e.reason}, status=e.status, headers={"Retry-After": str(e.retry_after)}
+        )
+    except RateLimitExceeded as e:
+        return json_response(
+            {"error": str(e)}, status=503, headers={"Retry-After": str(e.retry_after)}
+        )
+    except IdempotencyKeyReused as e:
+        return json_response({"error": str(e)}, status=422)
+    except json.JSONDecodeError:
+        return json_response({"error": "Invalid JSON"}, status=400)
+    except Exception as e:
+        return json_response({"error": str(e)}, status=500)
 
-            query = None
-            files = []
+async def process_query_request(request: web.Request, access_token: str) -> web.Response:
+    content_type = request.content_type
 
-            async for part in reader:
-                if part.name == "query":
-                    query = await part.text()
-                elif part.name == "files[]":
-                    filename = part.filename
-                    file_data = await part.read()
-                    files.append({"filename": filename, "data": file_data})
+    if content_type.startswith("application/json"):
+        data = await request.json(loads=loads)
+        query = data.get("query")
+        files = None
 
-        else:
-            logging.error({"error": f"Unsupported Content-Type: {content_type}"})
-            return web.json_response({"error": f"Unsupported Content-Type: {content_type}"}, status=415)
+    elif content_type.startswith("multipart/form-data"):
+        reader = await request.multipart()
 
-        if not query:
-            logging.error({"error": "Missing 'query' in request"})
-            return web.json_response({"error": "Missing 'query' in request"}, status=400)
+        query = None
+        files = []
 
-        use_case = request.app["use_case"]
-        result = await use_case.execute(query, access_token=access_token, files=files)
+        async for part in reader:
+            if part.name == "query":
+                query = await part.text()
+            elif part.name == "files[]":
+                filename = part.filename
+                file_data = await part.read()
+                files.append({"filename": filename, "data": file_data})
+                count_payload("uploaded_bytes", len(file_data))
+
+    else:
+        logger.error("Unsupported Content-Type: %s", content_type)
+        return json_response({"error": f"Unsupported Content-Type: {content_type}"}, status=415)
+
+    if not query:
+        logger.error("Missing 'query' in request")
+        return json_response({"error": "Missing 'query' in request"}, status=400)
+
+    is_async = is_async_request(request)
+    dedup = request.app["dedup"].key(
+        access_token, request.headers.get("Idempotency-Key"), query, files, mode="async" if is_async else "sync"
+    )
+
+    if is_async:
+        async def submit():
+            return request.app["jobs"].submit(query, access_token=access_token, files=files)
 
-        if files:
-            files.clear()
-            del files
+        job, replayed = await run_deduplicated(request, dedup, submit)
+        headers = {"Location": f"/jobs/{job.id}"}
+        if replayed:
+            headers["Idempotent-Replayed"] = "true"
+        return json_response(job.to_dict(), status=202, headers=headers)
 
-        return web.json_response({"result": result})
+    use_case = request.app["use_case"]
+    result, replayed = await run_deduplicated(
+        request, dedup, lambda: use_case.execute(query, access_token=access_token, files=files),
+        keep=lambda result: not is_failed(result)
+    )
+
+    if files:
+        files.clear()
+        del files
+
+    response = json_response({"result": result}, headers={"Idempotent-Replayed": "true"} if replayed else None)
+    count_payload("response_bytes", len(response.body))
+    return response
+
+async def run_deduplicated(request: web.Request, dedup, execute, keep=None):
+    # duplicates of a running or recently finished submission share its result
+    if dedup is None:
+        return await execute(), False
+    key, ttl, request_hash = dedup
+    return await request.app["dedup"].run(key, ttl, execute, request_hash=request_hash, keep=keep)
+
+async def handle_batch_request(request: web.Request) -> web.StreamResponse:
+    try:
+        auth_header = request.headers.get("Authorization")
+        if not auth_header or not auth_header.startswith("Bearer "):
+            return json_response({"error": "Missing or invalid Authorization header"}, status=401)
+        access_token = auth_header.split("Bearer ")[1]
+
+        return await process_batch_request(request, access_token)
+    except AdmissionRejected as e:
+        return json_response(
+            {"error": e.reason}, status=e.status, headers={"Retry-After": str(e.retry_after)}
+        )
     except json.JSONDecodeError:
-        return web.json_response({"error": "Invalid JSON"}, status=400)
+        return json_response({"error": "Invalid JSON"}, status=400)
     except Exception as e:
-        return web.json_response({"error": str(e)}, status=500)
+        return json_response({"error": str(e)}, status=500)
+
+async def process_batch_request(request: web.Request, access_token: str) -> web.StreamResponse:
+    data = await request.json(loads=loads)
+    items = data.get("queries") if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return json_response({"error": "Missing 'queries' in request"}, status=400)
+
+    queries = [item.get("query") if isinstance(item, dict) else item for item in items]
+    if not all(isinstance(query, str) and query for query in queries):
+        return json_response({"error": "Every query must be a non-empty string"}, status=400)
+
+    batch = request.app["batch"]
+    if len(queries) > batch["max_queries"]:
+        return json_response({"error": f"Too many queries, at most {batch['max_queries']} per batch"}, status=413)
+
+    stream = request.query.get("stream", "").lower() in ("1", "true", "yes") \
+        or "application/x-ndjson" in request.headers.get("Accept", "")
+
+    async with AsyncExitStack() as stack:
+        concurrency = await admit_batch(
+            request.app["admission"], access_token, min(batch["concurrency"], len(queries)), stack
+        )
+        use_case = request.app["use_case"]
+        results = await stack.enter_async_context(aclosing(
+            use_case.execute_batch(queries, access_token=access_token, concurrency=concurrency)
+        ))
+
+        if stream:
+            response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+            await response.prepare(request)
+            try:
+                async for index, result, error in results:
+                    if client_gone(request):
+                        break
+                    line = {"index": index, "result": result} if error is None else {"index": index, "error": error}
+                    await response.write(dumps_bytes(line) + b"\n")
+                else:
+                    await response.write_eof()
+            except ConnectionResetError:
+                pass
+            except Exception as e:
+                # the status line is already sent, the failure goes out as the last line
+                logger.exception("Batch stream failed")
+                await response.write(dumps_bytes({"error": str(e)}) + b"\n")
+                await response.write_eof()
+            return response
+
+        ordered = [None] * len(queries)
+        async for index, result, error in results:
+            if client_gone(request):
+                # leaving the loop closes the generator, which cancels the pending queries
+                return web.Response(status=499)
+            ordered[index] = {"result": result} if error is None else {"error": error}
+        return json_response({"results": ordered})
+
+async def admit_batch(admission: AdmissionController, access_token: str, wanted: int, stack: AsyncExitStack) -> int:
+    # every query of a batch running at once holds an admission slot like a request of its own;
+    # the first one queues like any request, the others are only taken when free right away and
+    # the batch runs with as many as it got
+    await stack.enter_async_context(admission.admit(access_token))
+    slots = 1
+    while slots < wanted:
+        try:
+            await stack.enter_async_context(admission.admit(access_token, wait=False))
+        except AdmissionRejected:
+            break
+        slots += 1
+    return slots
+
+def client_gone(request: web.Request) -> bool:
+    return request.transport is None or request.transport.is_closing()
+
+def is_async_request(request: web.Request) -> bool:
+    if request.query.get("async", "").lower() in ("1", "true", "yes"):
+        return True
+    return "respond-async" in request.headers.get("Prefer", "")
+
+async def handle_job_request(request: web.Request) -> web.StreamResponse:
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return json_response({"error": "Missing or invalid Authorization header"}, status=401)
+    access_token = auth_header.split("Bearer ")[1]
+
+    try:
+        wait = min(float(request.query.get("wait", 0) or 0), 30.0)
+    except ValueError:
+        return json_response({"error": "wait must be a number of seconds"}, status=400)
+
+    job = request.app["jobs"].get(request.match_info["job_id"], access_token)
+    if job is None:
+        return json_response({"error": "Job not found"}, status=404)
+
+    if "text/event-stream" in request.headers.get("Accept", ""):
+        return await stream_job_status(request, job)
+
+    if wait > 0 and not job.done.is_set():
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout=wait)
+        except asyncio.TimeoutError:
+            pass
+
+    return json_response(job.to_dict())
+
+async def handle_attachment_request(request: web.Request) -> web.Response:
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return json_response({"error": "Missing or invalid Authorization header"}, status=401)
+    access_token = auth_header.split("Bearer ")[1]
+
+    tool = await request.app["use_case"].tool_repo.get_tool("get_note", access_token=access_token)
+    try:
+        resource = await tool.get_resource(request.match_info["resource_id"])
+    except Exception as e:
+        return json_response({"error": str(e)}, status=502)
+
+    if resource is None:
+        return json_response({"error": "Attachment is too large"}, status=413)
+    if not resource:
+        return json_response({"error": "Attachment not found"}, status=404)
+
+    content, mime_type = resource
+    return web.Response(body=content, content_type=mime_type)
 
-async def start_http_server(use_case, host: str, port: int):
-    app = web.Application()
+async def handle_memory_request(request: web.Request) -> web.Response:
+    if not is_admin(request):
+        return json_response({"error": "Forbidden"}, status=403)
+
+    memory = request.app["memory"]
+    try:
+        limit = int(request.query.get("limit", 20) or 20)
+    except ValueError:
+        return json_response({"error": "limit must be an integer"}, status=400)
+    group_by = request.query.get("group", "lineno")
+    if limit <= 0:
+        return json_response({"error": "limit must be positive"}, status=400)
+    if group_by not in ("lineno", "filename", "traceback"):
+        return json_response({"error": "group must be lineno, filename or traceback"}, status=400)
+
+    if request.method == "POST":
+        try:
+            data = await request.json(loads=loads)
+        except ValueError:
+            return json_response({"error": "Body must be JSON"}, status=400)
+        if not isinstance(data, dict):
+            return json_response({"error": "Body must be a JSON object"}, status=400)
+        if data.get("tracing"):
+            try:
+                frames = int(data.get("frames") or 1)
+            except (TypeError, ValueError):
+                return json_response({"error": "frames must be an integer"}, status=400)
+            if frames <= 0:
+                return json_response({"error": "frames must be positive"}, status=400)
+            memory.start_tracing(frames)
+        else:
+            memory.stop_tracing()
+
+    return json_response({
+        "requests": memory.stats(),
+        "tracemalloc": await memory.snapshot(limit=limit, group_by=group_by),
+    })
+
+async def handle_loop_request(request: web.Request) -> web.Response:
+    if not is_admin(request):
+        return json_response({"error": "Forbidden"}, status=403)
+    return json_response(request.app["loop_monitor"].stats())
+
+async def handle_stats_request(request: web.Request) -> web.Response:
+    if not is_admin(request):
+        return json_response({"error": "Forbidden"}, status=403)
+    llm_service = request.app["use_case"].llm_service
+    compressor = request.app["compressor"]
+    return json_response({
+        "admission": request.app["admission"].stats(),
+        "dedup": request.app["dedup"].stats(),
+        "profiler": request.app["profiler"].stats(),
+        "compression": compressor.stats() if compressor else None,
+        "llm": llm_service.stats() if hasattr(llm_service, "stats") else None,
+    })
+
+async def handle_ready_request(request: web.Request) -> web.Response:
+    warmup = request.app["warmup"]
+    if warmup is None:
+        return json_response({"ready": True})
+    return json_response(warmup.stats(), status=200 if warmup.ready.is_set() else 503)
+
+async def stream_job_status(request: web.Request, job) -> web.StreamResponse:
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await response.prepare(request)
+
+    async def send(event):
+        await response.write(f"event: {event}\ndata: {dumps(job.to_dict())}\n\n".encode())
+
+    await send(job.status)
+    if job.status == "pending":
+        await job.started.wait()
+        await send(job.status)
+    if job.status == "running":
+        await job.done.wait()
+        await send(job.status)
+
+    await response.write_eof()
+    return response
+
+async def start_http_server(
+    use_case,
+    admission: AdmissionController,
+    jobs: JobManager,
+    batch: dict,
+    host: str,
+    port: int,
+    profiler: RequestProfiler,
+    memory: MemoryAccounting,
+    loop_monitor: LoopLagMonitor,
+    compressor: ResponseCompressor = None,
+    dedup: QueryDeduplicator = None,
+    warmup: Warmup = None,
+    admin_token: str = None
+):
+    middlewares = [request_context]
+    if compressor:
+        middlewares.append(compressor.middleware)
+    app = web.Application(middlewares=middlewares)
     app["use_case"] = use_case
+    app["admission"] = admission
+    app["jobs"] = jobs
+    app["batch"] = batch
+    app["profiler"] = profiler
+    app["memory"] = memory
+    app["loop_monitor"] = loop_monitor
+    app["dedup"] = dedup or QueryDeduplicator()
+    app["compressor"] = compressor
+    app["warmup"] = warmup
+    app["admin_token"] = admin_token
+
+    async def start_jobs(app):
+        await app["jobs"].start()
+
+    async def stop_jobs(app):
+        await app["jobs"].stop()
+
+    app.on_startup.append(start_jobs)
+    app.on_cleanup.append(stop_jobs)
     
     query_route = app.router.add_post("/query", handle_query_request)
+    batch_route = app.router.add_post("/query/batch", handle_batch_request)
+    job_route = app.router.add_get("/jobs/{job_id}", handle_job_request)
+    attachment_route = app.router.add_get("/attachments/{resource_id}", handle_attachment_request)
+    app.router.add_get("/admin/memory", handle_memory_request)
+    app.router.add_post("/admin/memory", handle_memory_request)
+    app.router.add_get("/admin/loop", handle_loop_request)
+    app.router.add_get("/admin/stats", handle_stats_request)
+    app.router.add_get("/ready", handle_ready_request)
 
     cors = aiohttp_cors.setup(app, defaults={
         "http://localhost:5173": aiohttp_cors.ResourceOptions(
@@ -77,6 +427,9 @@ async def start_http_server(use_case, host: str, port: int):
     })
 
     cors.add(query_route)
+    cors.add(batch_route)
+    cors.add(job_route)
+    cors.add(attachment_route)
 
     runner = web.AppRunner(app)
     await runner.setup()
@@ -86,25 +439,172 @@ async def start_http_server(use_case, host: str, port: int):
 
 async def main():
     load_dotenv()
+    log_listener = setup_logging(
+        level= os.getenv("LOG_LEVEL") or "INFO",
+        json_format= (os.getenv("LOG_FORMAT") or "json").lower() == "json",
+        sample_rates= parse_sample_rates(os.getenv("LOG_SAMPLE_RATES"))
+    )
+    
+    attachment_store = None
+    if os.getenv("ATTACHMENT_CACHE_DIR"):
+        attachment_store = AttachmentStore(
+            os.getenv("ATTACHMENT_CACHE_DIR"),
+            max_bytes= int(os.getenv("ATTACHMENT_CACHE_MAX_BYTES") or 512 * 1024 * 1024)
+        )
+    
+    # record production traffic, or replay a recording instead of calling the model and backends
+    traffic = open_traffic(
+        os.getenv("TRAFFIC_MODE"),
+        os.getenv("TRAFFIC_FILE"),
+        latency_scale= float(os.getenv("TRAFFIC_LATENCY_SCALE") or 1)
+    )
+    
+    backends = BackendSessions(
+        endpoints= {
+            name: os.getenv(f"{name.upper()}_BACKEND_URL")
+            for name in ("calendar", "joplin")
+            if os.getenv(f"{name.upper()}_BACKEND_URL")
+        },
+        limit= int(os.getenv("BACKEND_POOL_LIMIT") or 100),
+        keepalive_timeout= float(os.getenv("BACKEND_KEEPALIVE_TIMEOUT") or 30),
+        traffic= traffic
+    )
+    
+    prefetch = os.getenv("SPECULATIVE_PREFETCH", "").lower() in ("1", "true", "yes")
     
-    mcp_service = MCPService(host= os.getenv("MCP_HOST"), port= int(os.getenv("MCP_PORT")))
+    mcp_service = MCPService(
+        host= os.getenv("MCP_HOST"),
+        port= int(os.getenv("MCP_PORT")),
+        # lists are only kept once fetched when prefetch needs them, otherwise a change made
+        # outside this process would show up late; concurrent identical fetches are still shared
+        list_cache_ttl= float(os.getenv("LIST_CACHE_TTL") or (15 if prefetch else 0)),
+        event_index_ttl= float(os.getenv("EVENT_INDEX_TTL") or 15),
+        max_concurrent_downloads= int(os.getenv("ATTACHMENT_DOWNLOAD_CONCURRENCY") or 4),
+        max_attachment_bytes= int(os.getenv("ATTACHMENT_MAX_BYTES_PER_NOTE") or 25 * 1024 * 1024),
+        lazy_attachments= os.getenv("LAZY_ATTACHMENTS", "").lower() in ("1", "true", "yes"),
+        page_size= int(os.getenv("MCP_LIST_PAGE_SIZE") or 100),
+        cursor_ttl= float(os.getenv("MCP_LIST_CURSOR_TTL") or 300),
+        attachment_store= attachment_store,
+        backends= backends,
+        note_patch_support= os.getenv("NOTE_PATCH_SUPPORT", "").lower() in ("1", "true", "yes")
+    )
+    rate_limiter = LLMRateLimiter(
+        requests_per_minute= float(os.getenv("LLM_REQUESTS_PER_MINUTE") or 0),
+        tokens_per_minute= float(os.getenv("LLM_TOKENS_PER_MINUTE") or 0),
+        max_wait= float(os.getenv("LLM_RATE_LIMIT_MAX_WAIT") or 10)
+    )
+    endpoint_pool = None
+    if os.getenv("MODEL_ENDPOINTS"):
+        endpoint_pool = EndpointPool.from_spec(
+            os.getenv("MODEL_ENDPOINTS"),
+            default_api_key= os.getenv("MODEL_API_KEY"),
+            hedge= os.getenv("LLM_HEDGE", "").lower() in ("1", "true", "yes"),
+            hedge_initial_delay= float(os.getenv("LLM_HEDGE_INITIAL_DELAY") or 2)
+        )
+    stages = {}
+    for stage in ("plan", "resolve", "summary"):
+        temperature = os.getenv(f"MODEL_TEMPERATURE_{stage.upper()}")
+        stages[stage] = StageModels(
+            large= os.getenv(f"MODEL_NAME_{stage.upper()}") or os.getenv("MODEL_NAME"),
+            small= os.getenv(f"SMALL_MODEL_NAME_{stage.upper()}") or os.getenv("SMALL_MODEL_NAME"),
+            temperature= float(temperature) if temperature else None
+        )
+    router = ModelRouter(
+        stages,
+        default_model= os.getenv("MODEL_NAME"),
+        min_confidence= float(os.getenv("SMALL_MODEL_MIN_CONFIDENCE") or 0)
+    )
     llm_client = LLMClient(
         model= os.getenv("MODEL_NAME"),
         base_url= os.getenv("MODEL_BASE_URL"),
-        api_key= os.getenv("MODEL_API_KEY")
+        api_key= os.getenv("MODEL_API_KEY"),
+        rate_limiter= rate_limiter,
+        context_builder= ContextBuilder(token_budget= int(os.getenv("SUMMARY_TOKEN_BUDGET") or 6000)),
+        endpoint_pool= endpoint_pool,
+        router= router,
+        traffic= traffic
     )
     
     use_case = ProcessQueryUseCase(
         llm_service=llm_client,
-        tool_repo=mcp_service
+        tool_repo=mcp_service,
+        prefetch=prefetch,
+        recorder=traffic if isinstance(traffic, TrafficRecorder) else None
     )
     
+    admission = AdmissionController(
+        max_concurrent= int(os.getenv("MAX_CONCURRENT_QUERIES") or 16),
+        max_per_token= int(os.getenv("MAX_CONCURRENT_QUERIES_PER_TOKEN") or 4),
+        max_queue= int(os.getenv("QUERY_QUEUE_SIZE") or 64),
+        queue_timeout= float(os.getenv("QUERY_QUEUE_TIMEOUT") or 10)
+    )
+    
+    jobs = JobManager(
+        use_case,
+        workers= int(os.getenv("JOB_WORKERS") or 4),
+        max_pending= int(os.getenv("JOB_QUEUE_SIZE") or 100),
+        result_ttl= float(os.getenv("JOB_RESULT_TTL") or 600)
+    )
+    
+    batch = {
+        "concurrency": int(os.getenv("BATCH_CONCURRENCY") or 4),
+        "max_queries": int(os.getenv("BATCH_MAX_QUERIES") or 50)
+    }
+    
+    profiler = RequestProfiler(
+        directory= os.getenv("PROFILE_DIR") or "profiles",
+        sample_rate= float(os.getenv("PROFILE_SAMPLE_RATE") or 0),
+        interval= float(os.getenv("PROFILE_INTERVAL") or 0.005)
+    )
+    
+    memory = MemoryAccounting()
+    if os.getenv("TRACEMALLOC_FRAMES"):
+        memory.start_tracing(int(os.getenv("TRACEMALLOC_FRAMES")))
+    
+    loop_monitor = LoopLagMonitor(
+        interval= float(os.getenv("LOOP_LAG_INTERVAL") or 0.25),
+        threshold= float(os.getenv("LOOP_LAG_THRESHOLD") or 0.1)
+    )
+    loop_monitor.start()
+    
+    dedup = QueryDeduplicator(
+        key_ttl= float(os.getenv("IDEMPOTENCY_KEY_TTL") or 600),
+        window= float(os.getenv("QUERY_DEDUP_WINDOW") or 0)
+    )
+    
+    compressor = None
+    if (os.getenv("RESPONSE_COMPRESSION") or "true").lower() in ("1", "true", "yes"):
+        compressor = ResponseCompressor(
+            min_size= int(os.getenv("COMPRESSION_MIN_SIZE") or 1024),
+            offload_size= int(os.getenv("COMPRESSION_OFFLOAD_SIZE") or 64 * 1024)
+        )
+    
+    # the heavy modules are imported in worker threads once the listeners are up, with WARMUP the
+    # backend and LLM connections are opened too before /ready reports the instance as ready
+    steps = {"imports": lambda: preload("openai"), "mcp": mcp_service.load}
+    if os.getenv("WARMUP", "").lower() in ("1", "true", "yes"):
+        steps["backends"] = lambda: backends.warm(int(os.getenv("WARMUP_CONNECTIONS") or 2))
+        steps["llm"] = llm_client.warm
+    warmup = Warmup(steps, timeout= float(os.getenv("WARMUP_TIMEOUT") or 30))
+    
     http_runner = None
     async with anyio.create_task_group() as tg:
         # Start MCP server
         tg.start_soon(mcp_service.run)
         # Start HTTP server
-        http_runner = await start_http_server(use_case, host=os.getenv("API_HOST"), port=int(os.getenv("API_PORT")))
+        http_runner = await start_http_server(
+            use_case, admission, jobs, batch,
+            host=os.getenv("API_HOST"),
+            port=int(os.getenv("API_PORT")),
+            profiler=profiler,
+            memory=memory,
+            loop_monitor=loop_monitor,
+            compressor=compressor,
+            dedup=dedup,
+            warmup=warmup,
+            admin_token=os.getenv("ADMIN_TOKEN")
+        )
+        tg.start_soon(warmup.run)
         
         try:
             await anyio.sleep(float("inf"))
@@ -113,6 +613,20 @@ async def main():
         finally:
             if http_runner:
                 await http_runner.cleanup()
+            await loop_monitor.stop()
+            await mcp_service.close()
+            if isinstance(traffic, TrafficRecorder):
+                await traffic.close()
+            log_listener.stop()
+
+def use_uvloop() -> bool:
+    if os.getenv("USE_UVLOOP", "").lower() not in ("1", "true", "yes"):
+        return False
+    if importlib.util.find_spec("uvloop") is None:
+        logger.warning("USE_UVLOOP is set but uvloop is not installed, using the default event loop")
+        return False
+    return True
 
 if __name__ == "__main__":
-    anyio.run(main)
\ No newline at end of file
+    load_dotenv()
+    anyio.run(main, backend_options={"use_uvloop": use_uvloop()})
\ No newline at end of file
@@ -0,0 +1,7 @@
+import hmac
+
+
+def is_admin(request) -> bool:
+    admin_token = request.app.get("admin_token")
+    supplied = request.headers.get("X-Admin-Token", "")
+    return bool(admin_token) and hmac.compare_digest(supplied, admin_token)
@@ -0,0 +1,84 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrent: int = 16,
+        max_per_token: int = 4,
+        max_queue: int = 64,
+        queue_timeout: float = 10.0
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_per_token = max_per_token
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._per_token: dict[str, int] = {}
+        self._waiting = 0
+        self._running = 0
+        # exponential moving average of how long an admitted request holds its slot,
+        # used to estimate a useful Retry-After for rejected clients
+        self._avg_service_time = 1.0
+
+    def retry_after(self) -> int:
+        backlog = self._waiting + self._running
+        return max(1, math.ceil(self._avg_service_time * backlog / self.max_concurrent))
+
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "waiting": self._waiting,
+            "tokens": len(self._per_token),
+            "avg_service_time": round(self._avg_service_time, 3),
+        }
+
+    @asynccontextmanager
+    async def admit(self, token: str, wait: bool = True):
+        # without wait a slot is only taken when one is free right away, the queue is left alone
+        if self._per_token.get(token, 0) >= self.max_per_token:
+            raise AdmissionRejected(429, "Too many concurrent requests for this token", self.retry_after())
+
+        if self._semaphore.locked() and (not wait or self._waiting >= self.max_queue):
+            raise AdmissionRejected(503, "Server is busy, request queue is full", self.retry_after())
+
+        self._per_token[token] = self._per_token.get(token, 0) + 1
+        try:
+            if wait:
+                self._waiting += 1
+                try:
+                    await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+                except asyncio.TimeoutError:
+                    raise AdmissionRejected(503, "Timed out waiting for a free slot", self.retry_after())
+                finally:
+                    self._waiting -= 1
+            else:
+                await self._semaphore.acquire()
+
+            self._running += 1
+            started = time.monotonic()
+            try:
+                yield
+            finally:
+                self._running -= 1
+                self._semaphore.release()
+                elapsed = time.monotonic() - started
+                self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * elapsed
+        finally:
+            remaining = self._per_token[token] - 1
+            if remaining:
+                self._per_token[token] = remaining
+            else:
+                del self._per_token[token]
@@ -0,0 +1,121 @@
+import asyncio
+import zlib
+from typing import Callable, Optional
+
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# media types that are already compressed, recompressing them only burns CPU
+COMPRESSED_TYPES = (
+    "image/", "video/", "audio/", "font/woff",
+    "application/zip", "application/gzip", "application/x-gzip", "application/zstd",
+    "application/x-7z-compressed", "application/x-rar-compressed", "application/pdf",
+)
+
+
+def gzip_compress(body: bytes, level: int) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+
+def available_encoders(gzip_level: int = 6, brotli_quality: int = 5, zstd_level: int = 3) -> dict[str, Callable[[bytes], bytes]]:
+    # ordered by preference when the client accepts several with the same weight
+    encoders = {}
+    if zstandard:
+        encoders["zstd"] = zstandard.ZstdCompressor(level=zstd_level).compress
+    if brotli:
+        encoders["br"] = lambda body: brotli.compress(body, quality=brotli_quality)
+    encoders["gzip"] = lambda body: gzip_compress(body, gzip_level)
+    return encoders
+
+
+def parse_accept_encoding(header: str) -> dict[str, float]:
+    weights = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding] = weight
+    return weights
+
+
+class ResponseCompressor:
+    def __init__(
+        self,
+        min_size: int = 1024,
+        offload_size: int = 64 * 1024,
+        encoders: Optional[dict[str, Callable[[bytes], bytes]]] = None
+    ):
+        self.min_size = min_size
+        self.offload_size = offload_size
+        self.encoders = encoders or available_encoders()
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def choose(self, accept_encoding: str) -> Optional[str]:
+        weights = parse_accept_encoding(accept_encoding)
+        wildcard = weights.get("*", 0.0)
+        best, best_weight = None, 0.0
+        for coding in self.encoders:
+            weight = weights.get(coding, wildcard)
+            if weight > best_weight:
+                best, best_weight = coding, weight
+        return best
+
+    def compressible(self, request: web.Request, response: web.StreamResponse) -> bool:
+        if not isinstance(response, web.Response) or response.prepared or request.method == "HEAD":
+            return False
+        if response.status in (204, 304) or "Content-Encoding" in response.headers:
+            return False
+        body = response.body
+        if not isinstance(body, (bytes, bytearray)) or len(body) < self.min_size:
+            return False
+        return not response.content_type.startswith(COMPRESSED_TYPES)
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        response = await handler(request)
+        if not self.compressible(request, response):
+            return response
+
+        coding = self.choose(request.headers.get("Accept-Encoding", ""))
+        response.headers.add("Vary", "Accept-Encoding")
+        if coding is None:
+            return response
+
+        body = response.body
+        encode = self.encoders[coding]
+        # big bodies are compressed in a worker thread, zlib/brotli/zstd release the GIL
+        compressed = await asyncio.to_thread(encode, body) if len(body) >= self.offload_size else encode(body)
+        if len(compressed) >= len(body):
+            return response
+
+        self.bytes_in += len(body)
+        self.bytes_out += len(compressed)
+        response.body = compressed
+        response.headers["Content-Encoding"] = coding
+        return response
+
+    def stats(self) -> dict:
+        return {
+            "encodings": list(self.encoders),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
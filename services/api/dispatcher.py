@@ -0,0 +1,352 @@
+import asyncio
+import hashlib
+import logging
+import os
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Iterator, Optional
+
+import aiohttp
+from aiohttp import web
+from dotenv import load_dotenv
+from multidict import CIMultiDict
+
+from services.api.json_codec import json_response, loads
+from services.api.logs import parse_sample_rates, setup_logging
+from services.api.admin import is_admin
+
+logger = logging.getLogger(__name__)
+
+# Front dispatcher for several instances of main.py. Every request of a user (same bearer token)
+# goes to the same worker, so its list cache, event index, cursors, jobs and attachments stay
+# warm there. Workers are placed on a consistent hash ring: when one joins or leaves only the
+# users it gains or loses move, the others keep their worker.
+#   AFFINITY_WORKERS="http://10.0.0.1:8000|http://10.0.0.1:8001,http://10.0.0.2:8000|http://10.0.0.2:8001"
+#   python -m services.api.dispatcher
+# Each worker is "api url|mcp url", the API listener forwards to the former and the MCP listener
+# to the latter.
+
+HOP_HEADERS = frozenset((
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade", "host",
+))
+
+
+def ring_hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    def __init__(self, nodes: tuple = (), replicas: int = 128):
+        # virtual nodes spread each worker around the ring so the keys split evenly
+        self.replicas = replicas
+        self.nodes: set[str] = set()
+        self._points: list[int] = []
+        self._owners: list[str] = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        if node not in self.nodes:
+            self.nodes.add(node)
+            self._rebuild()
+
+    def remove(self, node: str):
+        if node in self.nodes:
+            self.nodes.discard(node)
+            self._rebuild()
+
+    def _rebuild(self):
+        points = sorted(
+            (ring_hash(f"{node}#{replica}"), node)
+            for node in self.nodes
+            for replica in range(self.replicas)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def lookup(self, key: str) -> Optional[str]:
+        return next(self.successors(key), None)
+
+    def successors(self, key: str) -> Iterator[str]:
+        # the owner first, then the nodes that inherit the key if it goes away
+        points, owners, count = self._points, self._owners, len(set(self._owners))
+        if not points:
+            return
+        start = bisect_right(points, ring_hash(key))
+        seen = set()
+        for offset in range(len(points)):
+            node = owners[(start + offset) % len(points)]
+            if node not in seen:
+                seen.add(node)
+                yield node
+                if len(seen) == count:
+                    return
+
+
+class Worker:
+    def __init__(self, api_url: str, mcp_url: Optional[str] = None):
+        self.api_url = api_url.rstrip("/")
+        self.mcp_url = (mcp_url or api_url).rstrip("/")
+        self.healthy = False
+        self.served = 0
+        self.failures = 0
+
+    @classmethod
+    def parse(cls, spec: str) -> list["Worker"]:
+        workers = []
+        for entry in filter(None, (part.strip() for part in spec.split(","))):
+            api_url, _, mcp_url = entry.partition("|")
+            workers.append(cls(api_url, mcp_url or None))
+        return workers
+
+    def url(self, listener: str) -> str:
+        return self.mcp_url if listener == "mcp" else self.api_url
+
+
+class AffinityDispatcher:
+    def __init__(
+        self,
+        workers: list[Worker],
+        replicas: int = 128,
+        health_interval: float = 2.0,
+        health_timeout: float = 2.0,
+        max_tracked_keys: int = 10000
+    ):
+        self.workers = {worker.api_url: worker for worker in workers}
+        self.ring = HashRing(replicas=replicas)
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        # last worker seen per key, to tell how often a user lands on a different worker
+        self.max_tracked_keys = max_tracked_keys
+        self._assigned: OrderedDict[int, str] = OrderedDict()
+        self.stable = 0
+        self.moved = 0
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._health_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        # bodies are passed through as they are, compressed or not
+        self._session = aiohttp.ClientSession(
+            auto_decompress=False,
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.health_timeout)
+        )
+        await self.check_health()
+        self._health_task = asyncio.create_task(self._watch_health())
+
+    async def stop(self):
+        if self._health_task:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    def set_workers(self, workers: list[Worker]):
+        current = {worker.api_url: worker for worker in workers}
+        for name in set(self.workers) - set(current):
+            self.ring.remove(name)
+            logger.info("Worker %s removed", name)
+        for name, worker in current.items():
+            if name not in self.workers:
+                self.workers[name] = worker
+                logger.info("Worker %s added", name)
+        self.workers = {name: self.workers[name] for name in current}
+
+    async def _watch_health(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check_health()
+
+    async def check_health(self):
+        workers = list(self.workers.values())
+        results = await asyncio.gather(*(self._ready(worker) for worker in workers))
+        for worker, ready in zip(workers, results):
+            self.mark(worker, ready)
+
+    async def _ready(self, worker: Worker) -> bool:
+        # /ready stays 503 while a worker warms up, it joins the ring once it answers 200
+        try:
+            timeout = aiohttp.ClientTimeout(total=self.health_timeout)
+            async with self._session.get(f"{worker.api_url}/ready", timeout=timeout) as response:
+                return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    def mark(self, worker: Worker, healthy: bool):
+        if worker.api_url not in self.workers or healthy == worker.healthy:
+            return
+        worker.healthy = healthy
+        if healthy:
+            self.ring.add(worker.api_url)
+            logger.info("Worker %s joined the ring (%d workers)", worker.api_url, len(self.ring.nodes))
+        else:
+            self.ring.remove(worker.api_url)
+            logger.warning("Worker %s left the ring (%d workers)", worker.api_url, len(self.ring.nodes))
+
+    @staticmethod
+    def route_key(request: web.Request) -> str:
+        # the bearer token is what the caches are keyed by, anonymous calls stick by client address
+        auth_header = request.headers.get("Authorization", "")
+        if auth_header.startswith("Bearer "):
+            return auth_header
+        forwarded = request.headers.get("X-Forwarded-For", "").split(",")[0].strip()
+        return forwarded or request.remote or ""
+
+    def track(self, key: str, worker: Worker):
+        digest = ring_hash(key)
+        previous = self._assigned.get(digest)
+        if previous is not None:
+            if previous == worker.api_url:
+                self.stable += 1
+            else:
+                self.moved += 1
+        self._assigned[digest] = worker.api_url
+        self._assigned.move_to_end(digest)
+        while len(self._assigned) > self.max_tracked_keys:
+            self._assigned.popitem(last=False)
+
+    def handler(self, listener: str):
+        async def handle(request: web.Request) -> web.StreamResponse:
+            return await self.dispatch(request, listener)
+        return handle
+
+    async def dispatch(self, request: web.Request, listener: str) -> web.StreamResponse:
+        key = self.route_key(request)
+        for name in self.ring.successors(key):
+            worker = self.workers.get(name)
+            if worker is None:
+                continue
+            try:
+                response = await self.forward(request, worker, listener)
+            except aiohttp.ClientConnectorError as e:
+                # nothing reached the worker and no byte of the body was read, the next one on the
+                # ring inherits the key
+                worker.failures += 1
+                logger.warning("Worker %s unreachable: %s", name, e)
+                self.mark(worker, False)
+                continue
+            self.track(key, worker)
+            return response
+        return json_response({"error": "No worker available"}, status=503, headers={"Retry-After": "1"})
+
+    async def forward(self, request: web.Request, worker: Worker, listener: str) -> web.StreamResponse:
+        headers = CIMultiDict(
+            (name, value) for name, value in request.headers.items() if name.lower() not in HOP_HEADERS
+        )
+        forwarded = request.headers.get("X-Forwarded-For")
+        headers["X-Forwarded-For"] = f"{forwarded}, {request.remote}" if forwarded else (request.remote or "")
+
+        async with self._session.request(
+            request.method,
+            worker.url(listener) + request.rel_url.path_qs,
+            headers=headers,
+            # the body streams through as it arrives, an upload is never held in memory here and the
+            # worker's own size limit applies
+            data=request.content if request.body_exists else None,
+            allow_redirects=False
+        ) as upstream:
+            worker.served += 1
+            response = web.StreamResponse(
+                status=upstream.status,
+                reason=upstream.reason,
+                headers=CIMultiDict(
+                    (name, value) for name, value in upstream.headers.items() if name.lower() not in HOP_HEADERS
+                )
+            )
+            response.headers["X-Served-By"] = worker.api_url
+            await response.prepare(request)
+            # streamed chunk by chunk so SSE (job status, MCP) keeps flowing
+            async for chunk in upstream.content.iter_any():
+                await response.write(chunk)
+            await response.write_eof()
+            return response
+
+    def stats(self) -> dict:
+        return {
+            "ring": sorted(self.ring.nodes),
+            "stable": self.stable,
+            "moved": self.moved,
+            "workers": [
+                {
+                    "api_url": worker.api_url,
+                    "mcp_url": worker.mcp_url,
+                    "healthy": worker.healthy,
+                    "served": worker.served,
+                    "failures": worker.failures,
+                }
+                for worker in self.workers.values()
+            ],
+        }
+
+
+async def handle_affinity_request(request: web.Request) -> web.Response:
+    if not is_admin(request):
+        return json_response({"error": "Forbidden"}, status=403)
+
+    dispatcher = request.app["dispatcher"]
+    if request.method == "POST":
+        # {"workers": "api|mcp,api|mcp"} replaces the membership, new workers join once ready
+        try:
+            data = await request.json(loads=loads)
+        except ValueError:
+            return json_response({"error": "Body must be JSON"}, status=400)
+        if not isinstance(data, dict) or not isinstance(data.get("workers") or "", str):
+            return json_response({"error": "Body must be an object with a workers string"}, status=400)
+        workers = Worker.parse(data.get("workers") or "")
+        if not workers:
+            return json_response({"error": "workers must list at least one worker"}, status=400)
+        dispatcher.set_workers(workers)
+        await dispatcher.check_health()
+    return json_response(dispatcher.stats())
+
+
+def build_app(dispatcher: AffinityDispatcher, listener: str, admin_token: Optional[str] = None) -> web.Application:
+    app = web.Application()
+    app["dispatcher"] = dispatcher
+    app["admin_token"] = admin_token
+    if listener == "api":
+        app.router.add_get("/admin/affinity", handle_affinity_request)
+        app.router.add_post("/admin/affinity", handle_affinity_request)
+    app.router.add_route("*", "/{tail:.*}", dispatcher.handler(listener))
+    return app
+
+
+async def main():
+    load_dotenv()
+    log_listener = setup_logging(
+        level= os.getenv("LOG_LEVEL") or "INFO",
+        json_format= (os.getenv("LOG_FORMAT") or "json").lower() == "json",
+        sample_rates= parse_sample_rates(os.getenv("LOG_SAMPLE_RATES"))
+    )
+
+    dispatcher = AffinityDispatcher(
+        Worker.parse(os.getenv("AFFINITY_WORKERS") or ""),
+        replicas= int(os.getenv("AFFINITY_REPLICAS") or 128),
+        health_interval= float(os.getenv("AFFINITY_HEALTH_INTERVAL") or 2)
+    )
+    await dispatcher.start()
+
+    host = os.getenv("DISPATCHER_HOST") or os.getenv("API_HOST")
+    runners = []
+    for listener, port in (("api", os.getenv("DISPATCHER_API_PORT")), ("mcp", os.getenv("DISPATCHER_MCP_PORT"))):
+        if not port:
+            continue
+        runner = web.AppRunner(build_app(dispatcher, listener, os.getenv("ADMIN_TOKEN")))
+        await runner.setup()
+        await web.TCPSite(runner, host, int(port)).start()
+        runners.append(runner)
+        logger.info("Dispatching %s requests on %s:%s", listener, host, port)
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+        await dispatcher.stop()
+        log_listener.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+
+class IdempotencyKeyReused(Exception):
+    pass
+
+
+class QueryDeduplicator:
+    # Identical submissions share one execution: a duplicate arriving while the first one runs
+    # awaits the same future, one arriving after it finished gets the stored result until the
+    # entry expires. Failed executions, and results the caller doesn't want kept, are forgotten so
+    # a retry runs again. An Idempotency-Key reused for a different request is refused.
+
+    def __init__(self, key_ttl: float = 600.0, window: float = 0.0, max_entries: int = 1024):
+        self.key_ttl = key_ttl
+        self.window = window
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, list] = OrderedDict()
+
+    def key(
+        self,
+        access_token: str,
+        idempotency_key: Optional[str],
+        query: str,
+        files: Optional[list[dict]],
+        mode: str
+    ) -> Optional[tuple[str, float, str]]:
+        # returns (key, ttl, request hash), or None when the request isn't deduplicated
+        request_digest = hashlib.sha256()
+        request_digest.update(b"query\0" + query.encode())
+        for file in files or []:
+            request_digest.update(b"\0" + hashlib.sha256(file["data"]).digest())
+        request_hash = request_digest.hexdigest()
+
+        digest = hashlib.sha256()
+        digest.update(access_token.encode())
+        digest.update(b"\0" + mode.encode() + b"\0")
+        if idempotency_key:
+            digest.update(b"key\0" + idempotency_key.encode())
+            return digest.hexdigest(), self.key_ttl, request_hash
+        if self.window <= 0:
+            return None
+        digest.update(request_hash.encode())
+        return digest.hexdigest(), self.window, request_hash
+
+    async def run(
+        self,
+        key: str,
+        ttl: float,
+        execute: Callable[[], Awaitable[Any]],
+        request_hash: Optional[str] = None,
+        keep: Optional[Callable[[Any], bool]] = None
+    ) -> tuple[Any, bool]:
+        # returns (result, replayed)
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, future, stored_hash = entry
+            if not future.done() or time.monotonic() < expires:
+                if stored_hash != request_hash:
+                    raise IdempotencyKeyReused("Idempotency-Key was already used for a different request")
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return await asyncio.shield(future), True
+
+        self.misses += 1
+        future = asyncio.ensure_future(execute())
+        entry = [float("inf"), future, request_hash]
+        self._entries[key] = entry
+        self._evict()
+
+        def settle(done: asyncio.Future):
+            if self._entries.get(key) is not entry:
+                return
+            if done.cancelled() or done.exception() is not None or (keep and not keep(done.result())):
+                del self._entries[key]
+            else:
+                entry[0] = time.monotonic() + ttl
+
+        future.add_done_callback(settle)
+        # shielded, the execution keeps going for the duplicates even if this client goes away
+        return await asyncio.shield(future), False
+
+    def _evict(self):
+        now = time.monotonic()
+        expired = [key for key, (expires, _, _) in self._entries.items() if expires <= now]
+        for key in expired:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
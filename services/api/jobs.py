@@ -0,0 +1,125 @@
+import asyncio
+import hashlib
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from services.api.admission import AdmissionRejected
+from services.api.logs import request_id
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    id: str
+    owner: str
+    query: str
+    access_token: Optional[str] = None
+    files: Optional[list[dict]] = None
+    request_id: Optional[str] = None
+    status: str = "pending"
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    started: asyncio.Event = field(default_factory=asyncio.Event)
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def to_dict(self) -> dict:
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == "done":
+            data["result"] = self.result
+        elif self.status == "failed":
+            data["error"] = self.error
+        return data
+
+
+class JobManager:
+    def __init__(self, use_case, workers: int = 4, max_pending: int = 100, result_ttl: float = 600.0):
+        self.use_case = use_case
+        self.workers = workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+
+        self._jobs: dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+
+    @staticmethod
+    def _owner(access_token: str) -> str:
+        return hashlib.sha256(access_token.encode()).hexdigest()
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, query: str, access_token: str, files: Optional[list[dict]] = None) -> Job:
+        self._evict_expired()
+
+        job = Job(
+            id=uuid.uuid4().hex,
+            owner=self._owner(access_token),
+            query=query,
+            access_token=access_token,
+            files=files,
+            request_id=request_id.get(),
+        )
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise AdmissionRejected(503, "Job queue is full", retry_after=5)
+
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str, access_token: str) -> Optional[Job]:
+        self._evict_expired()
+        job = self._jobs.get(job_id)
+        if job is None or job.owner != self._owner(access_token):
+            return None
+        return job
+
+    def _evict_expired(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.result_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started.set()
+            # log lines of the job carry the id of the request that submitted it
+            request_id.set(job.request_id or job.id)
+            try:
+                job.result = await self.use_case.execute(job.query, access_token=job.access_token, files=job.files)
+                job.status = "done"
+            except Exception as e:
+                logger.exception("Job %s failed", job.id)
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                # drop the request inputs as soon as the work is done, only the result is kept
+                job.access_token = None
+                job.files = None
+                job.finished_at = time.time()
+                job.done.set()
+                self._queue.task_done()
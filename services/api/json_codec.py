@@ -0,0 +1,44 @@
+import json
+from typing import Any, Callable, Optional
+
+from aiohttp import web
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson when it is installed, the stdlib otherwise. orjson writes compact UTF-8 and raises on
+# values it can't represent (e.g. integers above 64 bits), those fall back to the stdlib.
+
+CODEC = "orjson" if orjson else "json"
+
+if orjson:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(value: Any, default: Optional[Callable] = None) -> bytes:
+        try:
+            return orjson.dumps(value, default=default, option=ORJSON_OPTIONS)
+        except TypeError:
+            return json.dumps(value, default=default, ensure_ascii=False).encode()
+
+    def dumps(value: Any, default: Optional[Callable] = None) -> str:
+        return dumps_bytes(value, default).decode()
+
+    def loads(data: str | bytes) -> Any:
+        return orjson.loads(data)
+
+else:
+    def dumps(value: Any, default: Optional[Callable] = None) -> str:
+        return json.dumps(value, default=default, ensure_ascii=False, separators=(",", ":"))
+
+    def dumps_bytes(value: Any, default: Optional[Callable] = None) -> bytes:
+        return dumps(value, default).encode()
+
+    def loads(data: str | bytes) -> Any:
+        return json.loads(data)
+
+
+def json_response(data: Any, status: int = 200, headers: Optional[dict] = None) -> web.Response:
+    # encoded straight to bytes, web.json_response would round-trip through str
+    return web.Response(body=dumps_bytes(data), status=status, headers=headers, content_type="application/json")
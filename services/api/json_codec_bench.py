@@ -0,0 +1,63 @@
+import base64
+import json
+import os
+import timeit
+
+from services.api import json_codec
+
+# python -m services.api.json_codec_bench
+# compares the stdlib against the configured codec on payloads shaped like the real ones
+
+
+def payloads() -> dict:
+    events = [
+        {
+            "event_number": i,
+            "id": f"evt{i:06d}",
+            "summary": f"Weekly sync {i} with the platform team",
+            "start_time": "2025-06-18T10:00:00+07:00",
+            "end_time": "2025-06-18T11:00:00+07:00",
+            "location": "Jakarta",
+            "description": "Agenda: status, blockers, next steps. " * 3,
+        }
+        for i in range(500)
+    ]
+    attachments = {
+        "result": {
+            "summary": "Here is your note with its attachments.",
+            "files": [
+                {
+                    "id": f"res{i}",
+                    "title": f"scan{i}.png",
+                    "mime_type": "image/png",
+                    "blob": base64.b64encode(os.urandom(256 * 1024)).decode(),
+                }
+                for i in range(8)
+            ],
+        }
+    }
+    tool_args = {"summary": "Lunch with Alex", "start_time": "2025-06-18T12:00:00+07:00", "end_time": "2025-06-18T13:00:00+07:00"}
+    return {"event list": {"data": events}, "attachments": attachments, "tool arguments": tool_args}
+
+
+def measure(function, number: int) -> float:
+    return min(timeit.repeat(function, number=number, repeat=5)) / number
+
+
+def main():
+    print(f"codec: {json_codec.CODEC}")
+    print(f"{'payload':<16}{'size':>10}{'json dumps':>14}{'codec dumps':>14}{'json loads':>14}{'codec loads':>14}")
+    for name, value in payloads().items():
+        encoded = json.dumps(value)
+        number = max(1, 2_000_000 // len(encoded))
+        timings = [
+            measure(lambda: json.dumps(value).encode(), number),
+            measure(lambda: json_codec.dumps_bytes(value), number),
+            measure(lambda: json.loads(encoded), number),
+            measure(lambda: json_codec.loads(encoded), number),
+        ]
+        print(f"{name:<16}{len(encoded):>10}" + "".join(f"{timing * 1e6:>12.1f}us" for timing in timings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import contextvars
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+# correlates every log line of one request, child tasks inherit it
+request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# attributes every LogRecord has, anything else was passed through `extra=`
+STANDARD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in STANDARD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    # keeps a fraction of the records below WARNING for the configured logger prefixes
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + "."):
+                return rate >= 1 or random.random() < rate
+        return True
+
+
+class ContextQueueHandler(QueueHandler):
+    # runs on the caller's thread: capture the request id and render the message, the
+    # formatting and the actual I/O happen on the listener thread
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.request_id = request_id.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_sample_rates(spec: Optional[str]) -> dict[str, float]:
+    # "aiohttp.access=0.1,services.mcp=0.5"
+    rates = {}
+    for entry in filter(None, (part.strip() for part in (spec or "").split(","))):
+        name, _, rate = entry.partition("=")
+        rates[name.strip()] = float(rate or 1)
+    return rates
+
+
+def setup_logging(level: str = "INFO", json_format: bool = True, sample_rates: Optional[dict[str, float]] = None) -> QueueListener:
+    output = logging.StreamHandler(sys.stderr)
+    if json_format:
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    handler = ContextQueueHandler(log_queue)
+    if sample_rates:
+        handler.addFilter(SamplingFilter(sample_rates))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+    listener = QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    return listener
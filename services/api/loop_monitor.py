@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    # A coroutine wakes up every `interval` and measures how late it was scheduled. A watchdog
+    # thread watches its heartbeat: when the loop is stuck for longer than `threshold` it logs the
+    # loop thread's stack while the blocking code is still running, once per stall.
+
+    def __init__(self, interval: float = 0.25, threshold: float = 0.1, window: int = 240):
+        self.interval = interval
+        self.threshold = threshold
+        self.samples: deque[float] = deque(maxlen=window)
+        self.max_lag = 0.0
+        self.stalls = 0
+
+        self._heartbeat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._measure())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _measure(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._heartbeat = now
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                self.stalls += 1
+
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked <= self.threshold or reported == heartbeat:
+                continue
+            reported = heartbeat
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                logger.warning(
+                    "Event loop blocked for %.3fs, loop thread stack:\n%s",
+                    blocked, "".join(traceback.format_stack(frame))
+                )
+
+    def stats(self) -> dict:
+        ordered = sorted(self.samples)
+
+        def percentile(fraction: float) -> float:
+            if not ordered:
+                return 0.0
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 4)
+
+        return {
+            "interval": self.interval,
+            "threshold": self.threshold,
+            "last": round(self.samples[-1], 4) if self.samples else 0.0,
+            "p50": percentile(0.5),
+            "p99": percentile(0.99),
+            "max": round(self.max_lag, 4),
+            "stalls": self.stalls,
+        }
@@ -0,0 +1,139 @@
+import asyncio
+import contextvars
+import os
+import resource
+import time
+import tracemalloc
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+# payload counters of the request being handled, child tasks share the same dict
+request_payload: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("request_payload", default=None)
+
+PAYLOAD_METRICS = ("uploaded_bytes", "attachment_bytes", "list_items", "response_bytes")
+
+
+def count_payload(name: str, value: int):
+    payload = request_payload.get()
+    if payload is not None:
+        payload[name] = payload.get(name, 0) + value
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # not linux, fall back to the high-water mark
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MemoryAccounting:
+    def __init__(self, history: int = 200, snapshot_filters: Optional[list] = None):
+        self.history: deque[dict] = deque(maxlen=history)
+        self.maxima = {name: 0 for name in (*PAYLOAD_METRICS, "traced_peak", "rss_growth")}
+        self.requests = 0
+        self._in_flight = 0
+        self._previous: Optional[tracemalloc.Snapshot] = None
+        self._filters = snapshot_filters or [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ]
+
+    def start_tracing(self, frames: int = 1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._previous = None
+
+    def stop_tracing(self):
+        tracemalloc.stop()
+        self._previous = None
+
+    @asynccontextmanager
+    async def track(self, label: str = ""):
+        payload = {}
+        token = request_payload.set(payload)
+        tracing = tracemalloc.is_tracing()
+        # tracemalloc keeps a single peak, it is only reset when no other request is running,
+        # overlapping requests therefore report the peak of the shared window
+        if tracing and self._in_flight == 0:
+            tracemalloc.reset_peak()
+        traced_start = tracemalloc.get_traced_memory()[0] if tracing else 0
+        rss_start = rss_bytes()
+        started = time.monotonic()
+        overlapping = self._in_flight
+        self._in_flight += 1
+        try:
+            yield payload
+        finally:
+            self._in_flight -= 1
+            request_payload.reset(token)
+            entry = {
+                "label": label,
+                "duration": round(time.monotonic() - started, 3),
+                "overlapping": overlapping,
+                "rss_growth": max(0, rss_bytes() - rss_start),
+                **{name: payload.get(name, 0) for name in PAYLOAD_METRICS},
+            }
+            if tracing and tracemalloc.is_tracing():
+                entry["traced_peak"] = max(0, tracemalloc.get_traced_memory()[1] - traced_start)
+            self.record(entry)
+
+    def record(self, entry: dict):
+        self.requests += 1
+        self.history.append(entry)
+        for name in self.maxima:
+            self.maxima[name] = max(self.maxima[name], entry.get(name, 0))
+
+    async def snapshot(self, limit: int = 20, group_by: str = "lineno") -> dict:
+        if not tracemalloc.is_tracing():
+            return {"tracing": False}
+        # taking and comparing snapshots is slow, keep it off the loop
+        return await asyncio.to_thread(self._snapshot, limit, group_by)
+
+    def _snapshot(self, limit: int, group_by: str) -> dict:
+        snapshot = tracemalloc.take_snapshot().filter_traces(self._filters)
+        current, peak = tracemalloc.get_traced_memory()
+        result = {
+            "tracing": True,
+            "traced_current": current,
+            "traced_peak": peak,
+            "top": [
+                {"location": self._location(stat.traceback), "size": stat.size, "count": stat.count}
+                for stat in snapshot.statistics(group_by)[:limit]
+            ],
+        }
+        if self._previous is not None:
+            # growth since the previous call of this endpoint
+            result["diff"] = [
+                {
+                    "location": self._location(stat.traceback),
+                    "size": stat.size,
+                    "size_diff": stat.size_diff,
+                    "count_diff": stat.count_diff,
+                }
+                for stat in snapshot.compare_to(self._previous, group_by)[:limit]
+            ]
+        self._previous = snapshot
+        return result
+
+    @staticmethod
+    def _location(traceback: tracemalloc.Traceback) -> str:
+        return " <- ".join(f"{frame.filename}:{frame.lineno}" for frame in traceback)
+
+    def stats(self) -> dict:
+        recent = list(self.history)
+        return {
+            "rss": rss_bytes(),
+            "requests": self.requests,
+            "in_flight": self._in_flight,
+            "max": dict(self.maxima),
+            "average": {
+                name: round(sum(entry.get(name, 0) for entry in recent) / len(recent))
+                for name in (*PAYLOAD_METRICS, "rss_growth")
+            } if recent else {},
+            "recent": recent[-20:],
+        }
@@ -0,0 +1,193 @@
+import asyncio
+import cProfile
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager
+from types import FrameType
+from typing import Optional
+
+PROFILE_MODES = ("sample", "cprofile")
+
+
+class RequestProfiler:
+    # Two modes:
+    #   sample   - a background thread samples the loop thread's stack every `interval` seconds and
+    #              attributes it to the profiled request when the stack runs through the coroutine of one
+    #              of its tasks. Tasks spawned by the request are tracked through a task factory. Written
+    #              as collapsed stacks.
+    #   cprofile - deterministic cProfile of the loop thread while the request runs, written as pstats.
+    #              It sees every request running at the same time, so only one runs at once and it is admin only.
+
+    def __init__(
+        self,
+        directory: str = "profiles",
+        sample_rate: float = 0.0,
+        interval: float = 0.005
+    ):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.written = 0
+
+        self._owners: dict[asyncio.Task, tuple[str, Optional[FrameType]]] = {}
+        # outermost coroutine frame of every tracked task, looked up by the sampler thread
+        self._frames: dict[FrameType, str] = {}
+        self._samples: dict[str, Counter] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._wakeup = threading.Event()
+        # the sampler thread counts into a request's Counter, it is only taken away under this lock
+        self._samples_lock = threading.Lock()
+        self._cprofile_busy = False
+
+    def install(self, loop: asyncio.AbstractEventLoop):
+        # child tasks (gathered tools, downloads) inherit the profile of the task creating them
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+        previous = loop.get_task_factory()
+
+        def factory(loop, coro, context=None):
+            if previous is not None:
+                task = previous(loop, coro, context=context)
+            else:
+                task = asyncio.Task(coro, loop=loop, context=context)
+            entry = self._owners.get(asyncio.current_task(loop)) if self._owners else None
+            if entry is not None:
+                self._track(task, entry[0])
+                task.add_done_callback(self._untrack)
+            return task
+
+        loop.set_task_factory(factory)
+
+    def requested_mode(self, request, admin: bool) -> Optional[str]:
+        if admin:
+            mode = request.query.get("profile") or request.headers.get("X-Profile")
+            if mode:
+                return mode if mode in PROFILE_MODES else "sample"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    @asynccontextmanager
+    async def profile(self, mode: str):
+        profile_id = uuid.uuid4().hex[:12]
+        if mode == "cprofile" and not self._cprofile_busy:
+            async with self._cprofile(profile_id):
+                yield profile_id
+        else:
+            async with self._sample(profile_id):
+                yield profile_id
+
+    @asynccontextmanager
+    async def _sample(self, profile_id: str):
+        if self._loop is None:
+            self.install(asyncio.get_running_loop())
+        task = asyncio.current_task()
+        self._samples[profile_id] = Counter()
+        self._track(task, profile_id)
+        self._ensure_sampler()
+        try:
+            yield
+        finally:
+            self._untrack(task)
+            with self._samples_lock:
+                samples = self._samples.pop(profile_id)
+            await asyncio.to_thread(self._write_collapsed, profile_id, samples)
+
+    def _track(self, task: asyncio.Task, owner: str):
+        frame = getattr(task.get_coro(), "cr_frame", None)
+        self._owners[task] = (owner, frame)
+        if frame is not None:
+            self._frames[frame] = owner
+
+    def _untrack(self, task: asyncio.Task):
+        _, frame = self._owners.pop(task, (None, None))
+        if frame is not None:
+            self._frames.pop(frame, None)
+
+    def _owner_of(self, frame: Optional[FrameType]) -> Optional[str]:
+        # a running task's coroutine frames sit on the loop thread's stack, the innermost tracked one decides
+        while frame is not None:
+            owner = self._frames.get(frame)
+            if owner is not None:
+                return owner
+            frame = frame.f_back
+        return None
+
+    @asynccontextmanager
+    async def _cprofile(self, profile_id: str):
+        self._cprofile_busy = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self._cprofile_busy = False
+            await asyncio.to_thread(self._write_pstats, profile_id, profiler)
+
+    def _ensure_sampler(self):
+        self._wakeup.set()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run_sampler, name="request-profiler", daemon=True)
+            self._thread.start()
+
+    def _run_sampler(self):
+        while True:
+            if not self._samples:
+                # idle until the next profiled request
+                self._wakeup.clear()
+                if not self._samples:
+                    self._wakeup.wait()
+                continue
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self._loop_thread)
+            owner = self._owner_of(frame)
+            if owner is None:
+                continue
+            stack = collapse(frame)
+            with self._samples_lock:
+                samples = self._samples.get(owner)
+                if samples is not None:
+                    samples[stack] += 1
+
+    def _path(self, profile_id: str, suffix: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{profile_id}.{suffix}")
+
+    def _write_collapsed(self, profile_id: str, samples: Counter):
+        if not samples:
+            return
+        with open(self._path(profile_id, "folded"), "w") as file:
+            for stack, count in samples.most_common():
+                file.write(f"{stack} {count}\n")
+        self.written += 1
+
+    def _write_pstats(self, profile_id: str, profiler: cProfile.Profile):
+        profiler.dump_stats(self._path(profile_id, "pstats"))
+        self.written += 1
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self._samples) + int(self._cprofile_busy),
+            "written": self.written,
+            "sample_rate": self.sample_rate,
+        }
+
+
+def collapse(frame) -> str:
+    # root first, the event loop's own frames are cut off
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename.endswith(os.path.join("asyncio", "events.py")):
+            break
+        names.append(f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
@@ -0,0 +1,46 @@
+import asyncio
+import importlib
+import logging
+import time
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+async def preload(*modules: str):
+    # the import lock makes a request importing the same module meanwhile wait for this one
+    for module in modules:
+        await asyncio.to_thread(importlib.import_module, module)
+
+
+class Warmup:
+    # Runs once the listeners are up. /ready answers 503 until every step finished, failed or timed
+    # out, so a rolling deploy only routes traffic to an instance whose imports are loaded and
+    # connections are open. A failing step is logged and doesn't keep the instance out forever.
+    # Steps run in order, later ones rely on the modules the earlier ones imported off the loop.
+
+    def __init__(self, steps: dict[str, Callable[[], Awaitable]], timeout: float = 30.0):
+        self.steps = steps
+        self.timeout = timeout
+        self.ready = asyncio.Event()
+        self.results: dict[str, dict] = {}
+
+    async def run(self):
+        started = time.monotonic()
+        for name, step in self.steps.items():
+            await self._step(name, step)
+        self.ready.set()
+        logger.info("Warm-up finished in %.3fs", time.monotonic() - started)
+
+    async def _step(self, name: str, step: Callable[[], Awaitable]):
+        started = time.monotonic()
+        status = "ok"
+        try:
+            await asyncio.wait_for(step(), self.timeout)
+        except Exception as e:
+            status = "failed"
+            logger.warning("Warm-up step %s failed: %r", name, e)
+        self.results[name] = {"status": status, "seconds": round(time.monotonic() - started, 3)}
+
+    def stats(self) -> dict:
+        return {"ready": self.ready.is_set(), "steps": self.results}
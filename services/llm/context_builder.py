@@ -0,0 +1,143 @@
+from dataclasses import dataclass
+from typing import Any
+
+from services.api.json_codec import dumps
+
+
+DROPPED_FIELDS = frozenset({"id", "parent_id", "event_number", "note_number"})
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token, good enough for budgeting
+    return (len(text) + 3) // 4
+
+
+@dataclass
+class Section:
+    title: str
+    body: str
+    raw_tokens: int
+    is_table: bool = False
+
+
+@dataclass
+class BuiltContext:
+    text: str
+    tokens: int
+    raw_tokens: int
+    truncated: bool
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.raw_tokens - self.tokens)
+
+
+class ContextBuilder:
+    def __init__(self, token_budget: int = 6000, dropped_fields: frozenset = DROPPED_FIELDS):
+        self.token_budget = token_budget
+        self.dropped_fields = dropped_fields
+        self.total_tokens_saved = 0
+
+    def build(self, context: list) -> BuiltContext:
+        sections = [self._encode(item) for item in context]
+        raw_tokens = sum(section.raw_tokens for section in sections)
+
+        truncated = False
+        budget = self.token_budget
+        if budget and sum(estimate_tokens(section.body) for section in sections) > budget:
+            self._fit(sections, budget)
+            truncated = True
+
+        text = "\n\n".join(
+            f"{section.title}\n{section.body}" if section.title else section.body for section in sections
+        )
+        built = BuiltContext(text=text, tokens=estimate_tokens(text), raw_tokens=raw_tokens, truncated=truncated)
+        self.total_tokens_saved += built.tokens_saved
+        return built
+
+    def _encode(self, item: Any) -> Section:
+        if isinstance(item, dict) and "tool" in item:
+            title, data = f"response from {item['tool']}:", item.get("data")
+        else:
+            title, data = "", item
+
+        raw_tokens = (len(title) + self._raw_size(data) + 3) // 4
+
+        if isinstance(data, list) and data and all(self._is_row(row) for row in data):
+            return Section(title, self._table(data), raw_tokens, is_table=True)
+        if self._is_row(data):
+            return Section(title, self._fields(data), raw_tokens)
+        return Section(title, "" if data is None else str(data), raw_tokens)
+
+    def _raw_size(self, data: Any) -> int:
+        # approximate length of the repr the context used to be built from, without building it
+        if isinstance(data, list):
+            return sum(self._raw_size(item) + 2 for item in data) + 2
+        if self._is_row(data):
+            pairs = data.items() if isinstance(data, dict) else ((name, getattr(data, name)) for name in data.__slots__)
+            return sum(len(key) + self._raw_size(value) + 6 for key, value in pairs) + 2
+        return len(str(data)) + 2
+
+    @staticmethod
+    def _is_row(value: Any) -> bool:
+        return isinstance(value, dict) or hasattr(value, "__slots__")
+
+    def _row_items(self, row: Any) -> list[tuple]:
+        if isinstance(row, dict):
+            pairs = row.items()
+        else:
+            pairs = ((name, getattr(row, name)) for name in row.__slots__)
+        return [(key, value) for key, value in pairs if key not in self.dropped_fields]
+
+    @staticmethod
+    def _cell(value: Any) -> str:
+        if value is None or value == "":
+            return "-"
+        if isinstance(value, (list, dict)):
+            value = dumps(value, default=str)
+        return str(value).replace("\n", " ").replace("|", "/").strip()
+
+    def _table(self, rows: list) -> str:
+        rows = [self._row_items(row) for row in rows]
+        columns = []
+        for row in rows:
+            for key, value in row:
+                if key not in columns and value not in (None, ""):
+                    columns.append(key)
+
+        lines = [" | ".join(columns)]
+        for row in rows:
+            values = dict(row)
+            lines.append(" | ".join(self._cell(values.get(column)) for column in columns))
+        return "\n".join(lines)
+
+    def _fields(self, row: Any) -> str:
+        return "\n".join(
+            f"{key}: {self._cell(value)}" for key, value in self._row_items(row) if value not in (None, "")
+        )
+
+    def _fit(self, sections: list[Section], budget: int):
+        # share the budget fairly: small sections keep everything, large ones split what's left
+        ordered = sorted(sections, key=lambda section: len(section.body))
+        remaining = budget
+        for position, section in enumerate(ordered):
+            share = remaining // (len(ordered) - position)
+            if estimate_tokens(section.body) > share:
+                section.body = self._truncate(section, share)
+            remaining -= estimate_tokens(section.body)
+
+    @staticmethod
+    def _truncate(section: Section, tokens: int) -> str:
+        limit = max(0, tokens * 4)
+        if not section.is_table:
+            return section.body[:limit] + " ... [truncated]"
+
+        lines = section.body.split("\n")
+        kept, size = lines[:1], len(lines[0]) + 1
+        for line in lines[1:]:
+            if size + len(line) + 1 > limit:
+                break
+            kept.append(line)
+            size += len(line) + 1
+        kept.append(f"... ({len(lines) - len(kept)} more rows not shown)")
+        return "\n".join(kept)
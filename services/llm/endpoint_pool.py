@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import random
+import time
+from collections import defaultdict, deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+# openai is the slowest import of the service, it is loaded on first use (or by the warm-up)
+def failover_errors() -> tuple:
+    from openai import APIConnectionError, APITimeoutError, InternalServerError
+    return (APIConnectionError, APITimeoutError, InternalServerError)
+
+
+def api_error() -> type:
+    from openai import OpenAIError
+    return OpenAIError
+
+
+def never_sent(error: BaseException) -> bool:
+    # the connection to the provider was never established, so the request wasn't counted there;
+    # matched by name, openai wraps the ConnectError of whichever httpx build it ships with
+    while error is not None:
+        if type(error).__name__ in ("ConnectError", "ConnectTimeout"):
+            return True
+        error = error.__cause__
+    return False
+
+
+class Endpoint:
+    def __init__(self, base_url: str, api_key: str, failure_threshold: int = 3, cooldown: float = 30.0):
+        self.base_url = base_url
+        self.api_key = api_key
+        self._client = None
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self.outstanding = 0
+        self.failures = 0
+        self.unhealthy_until = 0.0
+        self.served = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(base_url=self.base_url, api_key=self.api_key)
+        return self._client
+
+    async def warm(self):
+        # opens the pooled connection (TCP + TLS) without spending tokens
+        await self.client.models.list()
+
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    def record_success(self):
+        self.failures = 0
+        self.served += 1
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.unhealthy_until = time.monotonic() + self.cooldown
+            logger.warning("LLM endpoint %s marked unhealthy for %.0fs", self.base_url, self.cooldown)
+
+
+class EndpointPool:
+    def __init__(
+        self,
+        endpoints: list[Endpoint],
+        hedge: bool = False,
+        hedge_percentile: float = 0.95,
+        hedge_initial_delay: float = 2.0,
+        min_samples: int = 20
+    ):
+        if not endpoints:
+            raise ValueError("EndpointPool needs at least one endpoint")
+        self.endpoints = endpoints
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_initial_delay = hedge_initial_delay
+        self.min_samples = min_samples
+        self.hedged = 0
+        self.hedge_wins = 0
+        # per (stage, model): the small and large tier of a stage answer at very different speeds
+        self._latencies: dict[tuple[str, Optional[str]], deque] = defaultdict(lambda: deque(maxlen=200))
+
+    @classmethod
+    def from_spec(cls, spec: str, default_api_key: Optional[str] = None, **kwargs) -> "EndpointPool":
+        # "url|key,url|key", the key may be left out to reuse the default one
+        endpoints = []
+        for entry in filter(None, (part.strip() for part in spec.split(","))):
+            base_url, _, api_key = entry.partition("|")
+            endpoints.append(Endpoint(base_url, api_key or default_api_key))
+        return cls(endpoints, **kwargs)
+
+    def pick(self, exclude: Optional[Endpoint] = None) -> Optional[Endpoint]:
+        candidates = [endpoint for endpoint in self.endpoints if endpoint is not exclude]
+        healthy = [endpoint for endpoint in candidates if endpoint.healthy()]
+        candidates = healthy or candidates
+        if not candidates:
+            return None
+        least = min(endpoint.outstanding for endpoint in candidates)
+        return random.choice([endpoint for endpoint in candidates if endpoint.outstanding == least])
+
+    def hedge_delay(self, stage: str, model: Optional[str] = None) -> float:
+        samples = self._latencies[(stage, model)]
+        if len(samples) < self.min_samples:
+            return self.hedge_initial_delay
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile))]
+
+    async def create(self, stage: str = "default", **kwargs):
+        primary = self.pick()
+        if not self.hedge or len(self.endpoints) < 2:
+            return await self._call_with_failover(primary, stage, kwargs)
+
+        first = asyncio.create_task(self._call(primary, stage, kwargs))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait({first}, timeout=self.hedge_delay(stage, kwargs.get("model")))
+            if done and not first.exception():
+                return first.result()
+            if done and not isinstance(first.exception(), failover_errors()):
+                # a rejected request (bad request, auth) fails the same way on any replica
+                raise first.exception()
+
+            # the primary is slower than the usual tail (or already failed), race a second replica
+            secondary = self.pick(exclude=primary)
+            second = asyncio.create_task(self._call(secondary, stage, kwargs))
+            tasks.append(second)
+            self.hedged += 1
+
+            pending = {second} if done else {first, second}
+            error = first.exception() if done else None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # also reached when the caller is cancelled while waiting, nothing keeps running for it
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _call_with_failover(self, endpoint: Endpoint, stage: str, kwargs: dict):
+        try:
+            return await self._call(endpoint, stage, kwargs)
+        except failover_errors():
+            fallback = self.pick(exclude=endpoint)
+            if fallback is None:
+                raise
+            return await self._call(fallback, stage, kwargs)
+
+    async def _call(self, endpoint: Endpoint, stage: str, kwargs: dict):
+        endpoint.outstanding += 1
+        started = time.monotonic()
+        try:
+            response = await endpoint.client.chat.completions.create(**kwargs)
+        except failover_errors():
+            endpoint.record_failure()
+            raise
+        finally:
+            endpoint.outstanding -= 1
+
+        endpoint.record_success()
+        self._latencies[(stage, kwargs.get("model"))].append(time.monotonic() - started)
+        return response
+
+    async def warm(self):
+        results = await asyncio.gather(*(endpoint.warm() for endpoint in self.endpoints), return_exceptions=True)
+        for endpoint, result in zip(self.endpoints, results):
+            if isinstance(result, Exception):
+                logger.warning("LLM endpoint %s warm-up failed: %s", endpoint.base_url, result)
+
+    def stats(self) -> dict:
+        return {
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "endpoints": [
+                {
+                    "base_url": endpoint.base_url,
+                    "outstanding": endpoint.outstanding,
+                    "served": endpoint.served,
+                    "healthy": endpoint.healthy(),
+                }
+                for endpoint in self.endpoints
+            ],
+        }
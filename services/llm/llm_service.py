@@ -1,13 +1,98 @@
 from datetime import datetime, timedelta, timezone
-import json
-from openai import AsyncOpenAI, OpenAIError
+import logging
+from typing import Callable, Optional
 from core.entities import LLMResponse
+from services.api.json_codec import dumps, loads
+from services.llm.context_builder import ContextBuilder
+from services.llm.endpoint_pool import Endpoint, EndpointPool, api_error, never_sent
+from services.llm.model_router import ModelRouter, validate_tool_calls
+from services.llm.rate_limiter import LLMRateLimiter, RateLimitExceeded, tools_size
 from services.mcp.tool_list import tool_dicts
 
+logger = logging.getLogger(__name__)
+
 class LLMClient:
-    def __init__(self, model: str, base_url: str, api_key: str):
-        self.client = AsyncOpenAI(base_url=base_url, api_key=api_key)
+    def __init__(
+        self,
+        model: str,
+        base_url: str,
+        api_key: str,
+        rate_limiter: Optional[LLMRateLimiter] = None,
+        context_builder: Optional[ContextBuilder] = None,
+        endpoint_pool: Optional[EndpointPool] = None,
+        router: Optional[ModelRouter] = None,
+        traffic=None
+    ):
+        self.pool = endpoint_pool or EndpointPool([Endpoint(base_url, api_key)])
+        if traffic is not None:
+            self.pool = traffic.wrap_pool(self.pool)
         self.model = model
+        self.router = router or ModelRouter({}, default_model=model)
+        self.rate_limiter = rate_limiter
+        self.context_builder = context_builder or ContextBuilder()
+        # argument resolution needs the ids the summary context leaves out
+        self.resolution_context = ContextBuilder(
+            token_budget=self.context_builder.token_budget, dropped_fields=frozenset()
+        )
+
+    async def warm(self):
+        tools_size(tool_dicts)
+        # the replay pool has nothing to connect to
+        if hasattr(self.pool, "warm"):
+            await self.pool.warm()
+
+    def stats(self) -> dict:
+        return {
+            "models": self.router.stats(),
+            "endpoints": self.pool.stats(),
+            "tokens_saved": {
+                "summary": self.context_builder.total_tokens_saved,
+                "resolve": self.resolution_context.total_tokens_saved,
+            },
+        }
+
+    async def _create(self, stage: str, **kwargs):
+        if not self.rate_limiter:
+            return await self.pool.create(stage, **kwargs)
+
+        reserved = await self.rate_limiter.acquire(
+            LLMRateLimiter.estimate_tokens(kwargs["messages"], kwargs.get("tools"))
+        )
+        used, sent = None, True
+        try:
+            response = await self.pool.create(stage, **kwargs)
+            used = getattr(getattr(response, "usage", None), "total_tokens", None)
+            return response
+        except Exception as e:
+            sent = not never_sent(e)
+            raise
+        finally:
+            # a call that got through but failed or was cancelled keeps its reservation spent
+            self.rate_limiter.settle(reserved, used, sent=sent)
+
+    async def _complete(self, stage: str, validate: Callable, temperature: float, **kwargs):
+        # cascade through the stage's tiers: a cheaper model answers first and the
+        # next tier only runs when its output fails validation or looks unsure
+        tiers = self.router.tiers(stage)
+        temperature = self.router.temperature(stage, temperature)
+        for position, (tier, model) in enumerate(tiers):
+            last = position == len(tiers) - 1
+            options = {"logprobs": True} if not last and self.router.min_confidence > 0 else {}
+            try:
+                response = await self._create(stage, model=model, temperature=temperature, **options, **kwargs)
+            except RateLimitExceeded:
+                raise
+            except Exception as e:
+                self.router.record_failure(stage, tier)
+                if last:
+                    raise
+                # escalating on a failure, not on a weak answer: a broken tier shows up here
+                logger.warning("%s tier %s (%s) failed, escalating: %r", stage, tier, model, e)
+                continue
+
+            if last or (validate(response) and self.router.confident(response)):
+                self.router.record(stage, tier, escalated=position > 0)
+                return response
     
     async def process_query(self, query: str) -> LLMResponse:
         try:
@@ -16,8 +101,9 @@ class LLMClient:
             WIB = timezone(timedelta(hours=7))
             curr_time_wib = datetime.now(WIB)
             
-            response = await self.client.chat.completions.create(
-                model=self.model,
+            response = await self._complete(
+                "plan",
+                lambda response: validate_tool_calls(response, tools),
                 messages=[{
                             "role": "system",
                             "content": (
@@ -35,6 +121,11 @@ class LLMClient:
                                 "{\"type\":\"function\",\"function\":{\"name\":\"delete_google_calendar_event\",\"arguments\":\"{\\\"event_name\\\":\\\"Lunch with Alex\\\"}\"}}]\n\n"
                                 "{\"type\":\"function\",\"function\":{\"name\":\"delete_google_calendar_event\",\"arguments\":\"{\\\"event_name\\\":\\\"Gary's birthday\\\"}\"}}]\n\n"
 
+                                "If an argument depends on the result of an earlier tool call in the same answer, do not guess it: "
+                                "put the placeholder `$result:N` in that argument, where N is the 1-based position of the earlier tool call. "
+                                "For example, for 'create an event from my note Trip plan tomorrow at 9' call get_note with title 'Trip plan' first, "
+                                "then create_google_calendar_event with summary `$result:1` and the times you can already determine.\n\n"
+
                                 "Only call tools that are needed. For events name use the exact wording"
                                 "All datetime values (such as `start_time` and `end_time`) MUST be in full RFC 3339 format **with timezone offset set to WIB (UTC+07:00)**.\n"
                                 "That means use format like `2025-06-18T21:15:15+07:00`. Do **not** use `Z` or leave the timezone blank.\n"
@@ -64,7 +155,7 @@ class LLMClient:
                 for tool_call in message.tool_calls:
                     tool_calls.append({
                         'name': tool_call.function.name,
-                        'args': json.loads(tool_call.function.arguments)
+                        'args': loads(tool_call.function.arguments)
                     })
             else:
                  return LLMResponse(
@@ -77,7 +168,9 @@ class LLMClient:
                 tool_calls=tool_calls
             )
         
-        except OpenAIError as e:
+        except RateLimitExceeded:
+            raise
+        except api_error() as e:
             return LLMResponse(content=f"LLM API error: {str(e)}", tool_calls=[])
         except Exception as e:
             return LLMResponse(content=f"Error: {str(e)}", tool_calls=[])
@@ -104,12 +197,13 @@ class LLMClient:
                 },
                 {
                     "role": "user",
-                    "content": f"User query: {query}\nArgs: {json.dumps(args)}\n"
+                    "content": f"User query: {query}\nArgs: {dumps(args)}\n"
                 }
             ]
 
-            response = await self.client.chat.completions.create(
-                model=self.model,
+            response = await self._complete(
+                "resolve",
+                lambda response: validate_tool_calls(response, [tool_needed], require_call=True),
                 messages=messages,
                 tools=[tool_needed],
                 temperature= 0.1
@@ -119,20 +213,87 @@ class LLMClient:
                 raise ValueError("No tool call returned")
 
             tool_call = response.choices[0].message.tool_calls[0]
-            updated_args = json.loads(tool_call.function.arguments)
+            updated_args = loads(tool_call.function.arguments)
             return updated_args
 
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             raise RuntimeError(f"Error processing single tool: {str(e)}")
     
+    async def resolve_arguments(self, query: str, steps: list[dict], context: list) -> list[dict]:
+        try:
+            names = {step["name"] for step in steps}
+            tools = list({
+                tool["function"]["name"]: tool for tool in tool_dicts if tool["function"]["name"] in names
+            }.values())
+
+            built = self.resolution_context.build(context)
+            pending = "\n".join(f"{step['step']}. {step['name']} {dumps(step['args'])}" for step in steps)
+
+            messages = [
+                {
+                    "role": "system",
+                    "content": (
+                        "You are resolving the arguments of several pending tool steps at once.\n"
+                        "Each pending step has draft arguments, some contain `$result:N` placeholders that refer to the result of step N.\n"
+                        "Replace every placeholder with concrete values taken from the given step results and keep the other arguments as they are.\n"
+                        "Return exactly one tool call per pending step, in the same order as the pending steps are listed.\n"
+                        "All datetime values MUST be in full RFC 3339 format **with timezone offset**.\n"
+                        "That means use format like `2025-09-06T13:00:00+07:00` with`+07:00` offset.\n"
+                    )
+                },
+                {
+                    "role": "user",
+                    "content": f"User query: {query}\n\nStep results:\n{built.text}\n\nPending steps:\n{pending}\n"
+                }
+            ]
+
+            response = await self._complete(
+                "resolve",
+                lambda response: validate_tool_calls(response, tools, require_call=True),
+                messages=messages,
+                tools=tools,
+                temperature= 0.1
+            )
+
+            tool_calls = []
+            if response.choices and response.choices[0].message.tool_calls:
+                tool_calls = list(response.choices[0].message.tool_calls)
+
+            resolved = []
+            for step in steps:
+                match = next((call for call in tool_calls if call.function.name == step["name"]), None)
+                if match is None:
+                    # the model skipped this one, fall back to resolving it on its own
+                    resolved.append(await self.process_single_tool(
+                        query=f"{query}\n\nStep results:\n{built.text}", tool_name=step["name"], args=step["args"]
+                    ))
+                    continue
+                tool_calls.remove(match)
+                resolved.append(loads(match.function.arguments))
+            return resolved
+
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Error resolving tool arguments: {str(e)}")
+
     async def summary(self, query: str, context: list) -> str:
         try:
+            built = self.context_builder.build(context)
+            logger.debug(
+                "summary context: %d tokens (%d saved%s)",
+                built.tokens, built.tokens_saved, ", truncated" if built.truncated else ""
+            )
+
             messages = [
                 {
                     "role": "system",
                     "content": (
                         "You are a helpful assistant that summarizes the context based on the query.\n"
                         "Context is the result of the system backend.\n"
+                        "Lists in the context are tables: a header row with the column names, then one row per item, columns separated by ' | ', '-' means empty.\n"
                         "Given context, generate a warm, natural-sounding summary.\n"
                         "If the context is a list, present the summary using a bulleted or numbered list that includes relevant details for each item.\n"
                         "If the context is a single object or paragraph, summarize it concisely in a human-like tone.\n"
@@ -147,19 +308,22 @@ class LLMClient:
                     "role": "user",
                     "content": (
                         f"query:\n{query}\n\n"
-                        f"context:\n{json.dumps(context)}\n\n"
+                        f"context:\n{built.text}\n\n"
                         "summarize them"
                     )
                 }
             ]
 
-            response = await self.client.chat.completions.create(
-                model=self.model,
+            response = await self._complete(
+                "summary",
+                lambda response: bool(response.choices and response.choices[0].message.content),
                 messages=messages,
                 temperature= 0.3
             )
 
             return response.choices[0].message.content
 
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             raise RuntimeError(f"Error processing single tool: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,116 @@
+import json
+import math
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from core.plan_executor import PLACEHOLDER
+from services.api.json_codec import loads
+
+DATETIME_ARGS = ("start_time", "end_time", "start_date", "end_date")
+JSON_TYPES = {"string": str, "array": list, "object": dict, "boolean": bool, "integer": int, "number": (int, float)}
+
+
+@dataclass
+class StageModels:
+    large: str
+    small: Optional[str] = None
+    temperature: Optional[float] = None
+
+
+class ModelRouter:
+    def __init__(self, stages: dict[str, StageModels], default_model: str, min_confidence: float = 0.0):
+        self.stages = stages
+        self.default_model = default_model
+        self.min_confidence = min_confidence
+        self._served = defaultdict(lambda: defaultdict(int))
+
+    def tiers(self, stage: str) -> list[tuple[str, str]]:
+        models = self.stages.get(stage)
+        if models is None:
+            return [("large", self.default_model)]
+        if models.small and models.small != models.large:
+            return [("small", models.small), ("large", models.large)]
+        return [("large", models.large)]
+
+    def temperature(self, stage: str, default: float) -> float:
+        models = self.stages.get(stage)
+        if models is None or models.temperature is None:
+            return default
+        return models.temperature
+
+    def record(self, stage: str, tier: str, escalated: bool):
+        self._served[stage][tier] += 1
+        if escalated:
+            self._served[stage]["escalated"] += 1
+
+    def record_failure(self, stage: str, tier: str):
+        self._served[stage][f"{tier}_failed"] += 1
+
+    def stats(self) -> dict:
+        return {stage: dict(counts) for stage, counts in self._served.items()}
+
+    def confident(self, response) -> bool:
+        if self.min_confidence <= 0:
+            return True
+        logprobs = getattr(response.choices[0], "logprobs", None) if response.choices else None
+        content = getattr(logprobs, "content", None) if logprobs else None
+        if not content:
+            # tool calls (or servers) without logprobs can't be judged, rely on validation alone
+            return True
+        mean = sum(token.logprob for token in content) / len(content)
+        return math.exp(mean) >= self.min_confidence
+
+
+def validate_tool_calls(response, tools: list[dict], require_call: bool = False) -> bool:
+    if not response.choices:
+        return False
+    message = response.choices[0].message
+    tool_calls = getattr(message, "tool_calls", None) or []
+    if not tool_calls:
+        return not require_call and bool(message.content)
+
+    schemas = {tool["function"]["name"]: tool["function"].get("parameters") for tool in tools}
+    for tool_call in tool_calls:
+        name = tool_call.function.name
+        if name not in schemas:
+            return False
+        try:
+            args = loads(tool_call.function.arguments or "{}")
+        except json.JSONDecodeError:
+            return False
+        if not isinstance(args, dict) or not valid_arguments(args, schemas[name]):
+            return False
+    return True
+
+
+def valid_arguments(args: dict, schema: Optional[dict]) -> bool:
+    if not schema:
+        return True
+    properties = schema.get("properties", {})
+
+    if any(required not in args for required in schema.get("required", [])):
+        return False
+    if schema.get("additionalProperties") is False and any(key not in properties for key in args):
+        return False
+
+    for key, value in args.items():
+        expected = JSON_TYPES.get(properties.get(key, {}).get("type"))
+        if value is not None and expected and not isinstance(value, expected):
+            return False
+        allowed = properties.get(key, {}).get("enum")
+        if value is not None and allowed and value not in allowed:
+            return False
+        if key in DATETIME_ARGS and isinstance(value, str) and not valid_datetime(value):
+            return False
+    return True
+
+
+def valid_datetime(value: str) -> bool:
+    if PLACEHOLDER.search(value):
+        return True
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).tzinfo is not None
+    except ValueError:
+        return False
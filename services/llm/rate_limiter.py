@@ -0,0 +1,106 @@
+import asyncio
+import math
+import time
+from typing import Optional
+
+from services.api.json_codec import dumps
+
+# encoded size of each tool definition, the definitions are static so each one is serialized once
+TOOL_SIZES: dict[str, int] = {}
+
+
+def tools_size(tools: list[dict]) -> int:
+    size = 0
+    for tool in tools:
+        name = tool["function"]["name"]
+        if name not in TOOL_SIZES:
+            TOOL_SIZES[name] = len(dumps(tool))
+        size += TOOL_SIZES[name]
+    return size
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"LLM rate limit exceeded, retry after {retry_after:.1f}s")
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        deficit = min(amount, self.capacity) - self._tokens
+        return deficit / self.rate if deficit > 0 else 0.0
+
+    def take(self, amount: float) -> float:
+        # the balance may go negative: callers reserve their share up front and
+        # sleep off the deficit, so later callers queue behind them in order
+        taken = min(amount, self.capacity)
+        self._tokens -= taken
+        return taken
+
+    def give_back(self, amount: float):
+        self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class LLMRateLimiter:
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_wait: float = 10.0
+    ):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_wait = max_wait
+
+    @staticmethod
+    def estimate_tokens(messages: list[dict], tools: Optional[list] = None, completion: int = 512) -> int:
+        size = len(dumps(messages))
+        if tools:
+            size += tools_size(tools)
+        # ~4 characters per token is close enough for budgeting purposes
+        return size // 4 + completion
+
+    async def acquire(self, estimated_tokens: int) -> int:
+        wait = 0.0
+        if self.requests:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens:
+            wait = max(wait, self.tokens.wait_time(estimated_tokens))
+
+        if wait > self.max_wait:
+            raise RateLimitExceeded(wait)
+
+        if self.requests:
+            self.requests.take(1)
+        # what the bucket actually took, settling never credits more than that
+        reserved = self.tokens.take(estimated_tokens) if self.tokens else 0
+
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self.settle(reserved, None, sent=False)
+                raise
+        return reserved
+
+    def settle(self, reserved_tokens: float, used_tokens: Optional[int], sent: bool = True):
+        # a call that never reached the provider gives its whole reservation back
+        if not sent:
+            if self.requests:
+                self.requests.give_back(1)
+            if self.tokens:
+                self.tokens.give_back(reserved_tokens)
+        elif self.tokens and used_tokens is not None and used_tokens < reserved_tokens:
+            self.tokens.give_back(reserved_tokens - used_tokens)
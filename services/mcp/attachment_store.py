@@ -0,0 +1,166 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import mmap
+import os
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AttachmentStore:
+    # blobs live under blobs/<digest>, shared by content; which resource ids a user may read
+    # is recorded per owner under resources/<owner>/<resource_id>.json
+    def __init__(self, root: str, max_bytes: int = 512 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._resources: dict[tuple[str, str], tuple[str, str]] = {}
+        self._by_digest: dict[tuple[str, str], str] = {}
+        self._blobs: OrderedDict[str, int] = OrderedDict()
+        self._total = 0
+        self._load()
+
+    @staticmethod
+    def owner(access_token: Optional[str]) -> str:
+        return hashlib.sha256((access_token or "").encode()).hexdigest()[:32]
+
+    @staticmethod
+    def digest(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, "blobs", digest[:2], digest)
+
+    def _resource_path(self, owner: str, resource_id: str) -> str:
+        return os.path.join(self.root, "resources", owner, f"{resource_id}.json")
+
+    def _load(self):
+        blobs = []
+        for directory, _, names in os.walk(os.path.join(self.root, "blobs")):
+            for name in names:
+                stat = os.stat(os.path.join(directory, name))
+                blobs.append((stat.st_mtime, name, stat.st_size))
+        for _, digest, size in sorted(blobs):
+            self._blobs[digest] = size
+            self._total += size
+
+        resources = os.path.join(self.root, "resources")
+        for owner in os.listdir(resources) if os.path.isdir(resources) else []:
+            for name in os.listdir(os.path.join(resources, owner)):
+                try:
+                    with open(os.path.join(resources, owner, name)) as f:
+                        meta = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                resource_id = name.removesuffix(".json")
+                self._resources[(owner, resource_id)] = (meta["digest"], meta["mime_type"])
+                self._by_digest[(owner, meta["digest"])] = resource_id
+
+    def find_resource(self, access_token: Optional[str], content: bytes) -> Optional[str]:
+        key = (self.owner(access_token), self.digest(content))
+        resource_id = self._by_digest.get(key)
+        if resource_id is None or key[1] not in self._blobs:
+            return None
+        return resource_id
+
+    async def read_base64(self, access_token: Optional[str], resource_id: str) -> Optional[tuple[str, str, int]]:
+        return await self._read(access_token, resource_id, encode=True)
+
+    async def read(self, access_token: Optional[str], resource_id: str) -> Optional[tuple[bytes, str, int]]:
+        return await self._read(access_token, resource_id, encode=False)
+
+    async def _read(self, access_token: Optional[str], resource_id: str, encode: bool):
+        entry = self._resources.get((self.owner(access_token), resource_id))
+        if entry is None or entry[0] not in self._blobs:
+            self.misses += 1
+            return None
+
+        digest, mime_type = entry
+        try:
+            content = await asyncio.to_thread(self._read_blob, digest, encode)
+        except OSError:
+            self._forget_blob(digest)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._blobs.move_to_end(digest)
+        return content, mime_type, self._blobs[digest]
+
+    def _read_blob(self, digest: str, encode: bool):
+        path = self._blob_path(digest)
+        os.utime(path)
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return "" if encode else b""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                # base64 straight from the mapping, the file is never copied into a bytes object first
+                return base64.b64encode(mapped).decode("utf-8") if encode else mapped[:]
+
+    async def put(self, access_token: Optional[str], resource_id: str, content: bytes, mime_type: str) -> str:
+        owner = self.owner(access_token)
+        digest = self.digest(content)
+        if len(content) > self.max_bytes:
+            return digest
+
+        try:
+            await asyncio.to_thread(self._write, owner, resource_id, digest, content, mime_type)
+        except OSError as e:
+            logger.warning("Failed to cache attachment %s: %s", resource_id, e)
+            return digest
+
+        if digest not in self._blobs:
+            self._blobs[digest] = len(content)
+            self._total += len(content)
+        self._blobs.move_to_end(digest)
+        self._resources[(owner, resource_id)] = (digest, mime_type)
+        self._by_digest[(owner, digest)] = resource_id
+        self._evict()
+        return digest
+
+    async def forget(self, access_token: Optional[str], resource_id: str):
+        # the backend no longer has the resource, content matching it is uploaded again
+        owner = self.owner(access_token)
+        entry = self._resources.pop((owner, resource_id), None)
+        if entry is None:
+            return
+        if self._by_digest.get((owner, entry[0])) == resource_id:
+            del self._by_digest[(owner, entry[0])]
+        try:
+            await asyncio.to_thread(os.remove, self._resource_path(owner, resource_id))
+        except OSError:
+            pass
+
+    def _write(self, owner: str, resource_id: str, digest: str, content: bytes, mime_type: str):
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(content)
+            os.replace(tmp, path)
+
+        meta_path = self._resource_path(owner, resource_id)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        with open(meta_path, "w") as f:
+            json.dump({"digest": digest, "mime_type": mime_type}, f)
+
+    def _evict(self):
+        while self._total > self.max_bytes and self._blobs:
+            digest, _ = next(iter(self._blobs.items()))
+            try:
+                os.remove(self._blob_path(digest))
+            except OSError:
+                pass
+            self._forget_blob(digest)
+
+    def _forget_blob(self, digest: str):
+        size = self._blobs.pop(digest, None)
+        if size is not None:
+            self._total -= size
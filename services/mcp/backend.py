@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import aiohttp
+
+from services.api.json_codec import dumps
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENDPOINTS = {
+    "calendar": "http://localhost:8080",
+    "joplin": "http://localhost:8081",
+}
+
+
+class Backend:
+    def __init__(self, endpoint: str, limit: int = 100, keepalive_timeout: float = 30.0):
+        # "unix:///path/to.sock" talks HTTP over a unix domain socket, anything else is a base url
+        if endpoint.startswith("unix://"):
+            self.socket_path = endpoint[len("unix://"):]
+            self.base_url = "http://localhost"
+        else:
+            self.socket_path = None
+            self.base_url = endpoint.rstrip("/")
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}{path}"
+
+    def get(self) -> aiohttp.ClientSession:
+        # created lazily so it binds to the running loop
+        if self._session is None or self._session.closed:
+            if self.socket_path:
+                connector = aiohttp.UnixConnector(
+                    path=self.socket_path, limit=self.limit, keepalive_timeout=self.keepalive_timeout
+                )
+            else:
+                connector = aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(connector=connector, json_serialize=dumps)
+        return self._session
+
+    async def warm(self, connections: int = 1):
+        # concurrent requests each open their own connection, they stay in the pool afterwards,
+        # whatever status the backend answers with
+        async def touch():
+            async with self.get().get(self.url("/")) as response:
+                await response.read()
+
+        await asyncio.gather(*(touch() for _ in range(min(connections, self.limit or connections))))
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+class BackendSessions:
+    def __init__(
+        self,
+        endpoints: Optional[dict[str, str]] = None,
+        limit: int = 100,
+        keepalive_timeout: float = 30.0,
+        traffic=None
+    ):
+        # traffic records the exchanges or replays recorded ones (services.replay.traffic)
+        self.traffic = traffic
+        endpoints = {**DEFAULT_ENDPOINTS, **(endpoints or {})}
+        self.backends = {
+            name: Backend(endpoint, limit=limit, keepalive_timeout=keepalive_timeout)
+            for name, endpoint in endpoints.items()
+        }
+
+    def url(self, backend: str, path: str) -> str:
+        return self.backends[backend].url(path)
+
+    @asynccontextmanager
+    async def session(self, backend: str):
+        # the shared session outlives the request, so it is not closed here
+        if self.traffic is None:
+            yield self.backends[backend].get()
+        elif self.traffic.offline:
+            yield self.traffic.wrap_session(backend)
+        else:
+            yield self.traffic.wrap_session(backend, self.backends[backend].get())
+
+    async def warm(self, connections: int = 1):
+        if self.traffic is not None and self.traffic.offline:
+            return
+        names = list(self.backends)
+        results = await asyncio.gather(
+            *(self.backends[name].warm(connections) for name in names), return_exceptions=True
+        )
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                logger.warning("Backend %s warm-up failed: %r", name, result)
+
+    async def close(self):
+        for backend in self.backends.values():
+            await backend.close()
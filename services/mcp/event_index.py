@@ -0,0 +1,69 @@
+from bisect import bisect_left, bisect_right
+from datetime import timezone
+from typing import Optional
+
+import dateutil.parser
+
+from services.mcp.records import EventRecord
+
+
+def parse_instant(value: Optional[str]) -> Optional[float]:
+    # timestamps are compared as UTC epoch seconds, naive values (and all-day dates) are taken as UTC
+    if not value:
+        return None
+    try:
+        dt = dateutil.parser.isoparse(value)
+    except (ValueError, OverflowError, TypeError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class EventIndex:
+    # Events sorted by start time, parsed once when the list is fetched. A lookup bisects on the
+    # start times and only walks back as far as the longest event can reach, so range, overlap
+    # and duplicate checks cost O(log n + k) instead of a scan that re-parses every timestamp.
+
+    def __init__(self, records: list[EventRecord], since: Optional[float] = None):
+        self.records = records
+        # the unbounded list only holds upcoming events: it is complete from `since` (no later than
+        # when it was fetched) up to the last start it contains, the backend may cut it off there
+        self.since = since
+        entries = []
+        for record in records:
+            start = parse_instant(record.start_time)
+            if start is None:
+                continue
+            end = parse_instant(record.end_time)
+            if end is None or end < start:
+                end = start
+            entries.append((start, end, record))
+        entries.sort(key=lambda entry: entry[0])
+
+        self.starts = [start for start, _, _ in entries]
+        self.ends = [end for _, end, _ in entries]
+        self.events = [record for _, _, record in entries]
+        self.max_duration = max((end - start for start, end, _ in entries), default=0.0)
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def covers(self, start: Optional[float], end: Optional[float]) -> bool:
+        if self.since is None or start is None or end is None or start < self.since:
+            return False
+        return not self.starts or end <= self.starts[-1]
+
+    def overlapping(self, start: Optional[float] = None, end: Optional[float] = None) -> list[EventRecord]:
+        # events intersecting [start, end), either bound may be open
+        lo = 0 if start is None else bisect_left(self.starts, start - self.max_duration)
+        hi = len(self.starts) if end is None else bisect_left(self.starts, end)
+        if start is None:
+            return self.events[lo:hi]
+        return [
+            self.events[i] for i in range(lo, hi)
+            if self.ends[i] > start or self.starts[i] >= start
+        ]
+
+    def starting_at(self, instant: float) -> list[EventRecord]:
+        return self.events[bisect_left(self.starts, instant):bisect_right(self.starts, instant)]
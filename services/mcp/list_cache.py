@@ -0,0 +1,108 @@
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Optional
+
+_scoped: ContextVar[Optional["ListCache"]] = ContextVar("scoped_list_cache", default=None)
+
+
+class ListCache:
+    def __init__(self, ttl: float = 15.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, list] = OrderedDict()
+
+    async def get_or_fetch(
+        self,
+        access_token: Optional[str],
+        key: tuple,
+        fetch: Callable[[], Awaitable[dict]],
+        ttl: Optional[float] = None
+    ) -> dict:
+        if access_token is None:
+            return await fetch()
+
+        full_key = (access_token, *key)
+        entry = self._entries.get(full_key)
+        if entry is not None:
+            expires, future = entry
+            if not future.done() or time.monotonic() < expires:
+                self.hits += 1
+                self._entries.move_to_end(full_key)
+                return await asyncio.shield(future)
+
+        self.misses += 1
+        future = asyncio.ensure_future(fetch())
+        entry = [float("inf"), future]
+        self._entries[full_key] = entry
+        self._evict()
+
+        try:
+            result = await asyncio.shield(future)
+        except Exception:
+            self._drop(full_key, entry)
+            raise
+
+        # failed fetches come back without data, don't let them stick around
+        if not result or result.get("data") is None:
+            self._drop(full_key, entry)
+        else:
+            entry[0] = time.monotonic() + (self.ttl if ttl is None else ttl)
+        return result
+
+    def peek(self, access_token: str, key: tuple) -> Optional[dict]:
+        entry = self._entries.get((access_token, *key))
+        if entry is None:
+            return None
+        expires, future = entry
+        if not future.done() or future.cancelled() or future.exception() or time.monotonic() >= expires:
+            return None
+        return future.result()
+
+    def put(self, access_token: Optional[str], key: tuple, result: dict):
+        if access_token is None:
+            return
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(result)
+        self._entries[(access_token, *key)] = [time.monotonic() + self.ttl, future]
+        self._entries.move_to_end((access_token, *key))
+        self._evict()
+
+    def invalidate(self, access_token: str, name: Optional[str] = None):
+        stale = [
+            key for key in self._entries
+            if key[0] == access_token and (name is None or key[1] == name)
+        ]
+        for key in stale:
+            del self._entries[key]
+
+    def _drop(self, full_key: tuple, entry: list):
+        if self._entries.get(full_key) is entry:
+            del self._entries[full_key]
+
+    def _evict(self):
+        now = time.monotonic()
+        expired = [key for key, (expires, _) in self._entries.items() if expires <= now]
+        for key in expired:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+def scoped_cache() -> Optional[ListCache]:
+    return _scoped.get()
+
+
+@contextmanager
+def shared_scope():
+    # tasks created inside share a cache of their own (the queries of one batch), kept for as long
+    # as they run whatever the list cache TTL is, and dropped with them
+    token = _scoped.set(ListCache(ttl=float("inf")))
+    try:
+        yield
+    finally:
+        _scoped.reset(token)
@@ -1,26 +1,56 @@
+import asyncio
 import base64
-from dataclasses import dataclass
-import json
+from dataclasses import dataclass, replace
 import logging
+import time
 from typing import Optional
+from urllib.parse import quote
 import aiohttp
-from fastmcp import FastMCP
 from core.entities import Tool
+from services.api.json_codec import dumps, loads
+from services.api.memory import count_payload
+from services.mcp.attachment_store import AttachmentStore
+from services.mcp.backend import DEFAULT_ENDPOINTS, BackendSessions
+from services.mcp.event_index import EventIndex, parse_instant
+from services.mcp.list_cache import ListCache, scoped_cache, shared_scope
+from services.mcp.note_patch import NOTE_OPERATIONS, PatchError, apply_operation
+from services.mcp.pagination import CursorStore, InvalidCursor, decode_cursor, encode_cursor, project
+from services.mcp.records import EventRecord, FolderRecord, NoteRecord, to_plain
 from thefuzz import fuzz
 import dateutil.parser
 
-logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 @dataclass
-class BaseTool:
-    list_tool: Tool
+class HttpTool:
+    http: Optional[BackendSessions] = None
+    backend: str = "calendar"
+
+    def session(self):
+        if self.http:
+            return self.http.session(self.backend)
+        return aiohttp.ClientSession(json_serialize=dumps)
+
+    def url(self, path: str) -> str:
+        if self.http:
+            return self.http.url(self.backend, path)
+        return f"{DEFAULT_ENDPOINTS[self.backend]}{path}"
+
+@dataclass
+class BaseTool(HttpTool):
+    list_tool: Optional[Tool] = None
     access_token: Optional[str] = None
+    attachments: Optional[AttachmentStore] = None
 
     def set_access_token(self, token: str):
         self.access_token = token
         if hasattr(self.list_tool, 'set_access_token'):
             self.list_tool.set_access_token(token)
 
+    def invalidate_cache(self):
+        if hasattr(self.list_tool, 'invalidate'):
+            self.list_tool.invalidate()
+
 @dataclass
 class CreateEventTool(BaseTool, Tool):
     name: str = "create_google_calendar_event"
@@ -35,25 +65,30 @@ class CreateEventTool(BaseTool, Tool):
         description: Optional[str] = None,
         attendees: Optional[list[str]] = None
     ) -> dict:
-        events_result = await self.list_tool.execute()
-        events = events_result.get("data", [])
+        index = await self.list_tool.index()
+        events = []
+        if index is not None:
+            # only events starting at the same instant can be duplicates, fuzzy match just those
+            start = parse_instant(start_time)
+            if start is not None:
+                events = index.starting_at(start)
+            else:
+                events = [e for e in index.records if e.start_time == start_time]
 
         if events:
             for e in events:
-                score1 = fuzz.partial_ratio(e.get("summary", ""), summary)
-                score2 = fuzz.token_set_ratio(e.get("summary", ""), summary)
+                score1 = fuzz.partial_ratio(e.summary, summary)
+                score2 = fuzz.token_set_ratio(e.summary, summary)
                 
                 score = (score1 + score2) // 2
 
                 if score > 90:
-                    dt = dateutil.parser.isoparse(e['start_time'])
-
-                    if start_time == e['start_time']:
-                        return {"data": f"Event '{summary}' already exists at {dt}"}
+                    dt = dateutil.parser.isoparse(e.start_time)
+                    return {"data": f"Event '{summary}' already exists at {dt}"}
             
         try:
-            async with aiohttp.ClientSession() as session:
-                url = "http://localhost:8080/calendar/events"
+            async with self.session() as session:
+                url = self.url("/calendar/events")
                 headers = {
                     "Authorization": f"Bearer {self.access_token}",
                     "Accept": "application/json"
@@ -73,7 +108,8 @@ class CreateEventTool(BaseTool, Tool):
                 ]
                 async with session.post(url, headers=headers, json=params) as response:
                     if response.status == 200:
-                        data = await response.json()
+                        self.invalidate_cache()
+                        data = await response.json(loads=loads)
                         return {"data": data}
                     else:
                         error_text = await response.text()
@@ -102,15 +138,15 @@ class EditEventTool(BaseTool, Tool):
         found = False
         if events:
             for e in events:
-                score1 = fuzz.partial_ratio(e.get("summary", ""), prior_event_name)
-                score2 = fuzz.token_set_ratio(e.get("summary", ""), prior_event_name)
+                score1 = fuzz.partial_ratio(e.summary, prior_event_name)
+                score2 = fuzz.token_set_ratio(e.summary, prior_event_name)
                 
                 score = (score1 + score2) // 2
 
                 if score > 80:
-                    eventId = e['id']
-                    curr_start_time = e['start_time']
-                    curr_end_time = e['end_time']
+                    eventId = e.id
+                    curr_start_time = e.start_time
+                    curr_end_time = e.end_time
                     found = True
                     break
 
@@ -118,8 +154,8 @@ class EditEventTool(BaseTool, Tool):
             if not found:
                 raise ValueError("The event was not found")
             
-            async with aiohttp.ClientSession() as session:
-                url = "http://localhost:8080/calendar/edit/events"
+            async with self.session() as session:
+                url = self.url("/calendar/edit/events")
                 headers = {
                     "Authorization": f"Bearer {self.access_token}",
                     "Accept": "application/json"
@@ -144,7 +180,8 @@ class EditEventTool(BaseTool, Tool):
                     }
                 async with session.post(url, headers=headers, json=params) as response:
                     if response.status == 200:
-                        data = await response.json()
+                        self.invalidate_cache()
+                        data = await response.json(loads=loads)
                         return {"data": data}
                     else:
                         error_text = await response.text()
@@ -163,17 +200,17 @@ class DeleteEventTool(BaseTool, Tool):
 
         if events:
             for e in events:
-                score1 = fuzz.partial_ratio(e.get("summary", ""), summary)
-                score2 = fuzz.token_set_ratio(e.get("summary", ""), summary)
+                score1 = fuzz.partial_ratio(e.summary, summary)
+                score2 = fuzz.token_set_ratio(e.summary, summary)
                 
                 score = (score1 + score2) // 2
                 if score > 80:
-                    eventId = e['id']
+                    eventId = e.id
                     break
 
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"http://localhost:8080/calendar/delete/events/{eventId}"
+            async with self.session() as session:
+                url = self.url(f"/calendar/delete/events/{eventId}")
                 headers = {
                     "Authorization": f"Bearer {self.access_token}",
                     "Accept": "application/json"
@@ -181,7 +218,8 @@ class DeleteEventTool(BaseTool, Tool):
 
                 async with session.post(url, headers=headers) as response:
                     if response.status == 200:
-                        data = await response.json()
+                        self.invalidate_cache()
+                        data = await response.json(loads=loads)
                         return {"data": data}
                     else:
                         error_text = await response.text()
@@ -190,18 +228,79 @@ class DeleteEventTool(BaseTool, Tool):
             return {"data": f"Failed to edit event: {str(e)}"}
 
 @dataclass
-class ListEventsTool(Tool):
-    name: str = "list_google_calendar_events"
-    description: str = "List upcoming events within a time range."
+class ListTool(HttpTool):
     access_token: Optional[str] = None
+    cache: Optional[ListCache] = None
 
     def set_access_token(self, token: str):
         self.access_token = token
 
+    @property
+    def active_cache(self) -> Optional[ListCache]:
+        # inside a batch its own cache takes over, lists are shared by its queries even with TTL 0
+        return scoped_cache() or self.cache
+
+    def invalidate(self):
+        # a mutation can affect any list of the user (e.g. a new note in a new folder)
+        for cache in (self.cache, scoped_cache()):
+            if cache:
+                cache.invalidate(self.access_token)
+
+    async def cached(self, key: tuple, fetch, ttl: Optional[float] = None) -> dict:
+        cache = self.active_cache
+        if not cache:
+            result = await fetch()
+        else:
+            result = await cache.get_or_fetch(self.access_token, (self.name, *key), fetch, ttl=ttl)
+        if isinstance(result.get("data"), list):
+            count_payload("list_items", len(result["data"]))
+        return result
+
+@dataclass
+class ListEventsTool(ListTool, Tool):
+    name: str = "list_google_calendar_events"
+    description: str = "List upcoming events within a time range."
+    index_ttl: float = 15.0
+
     async def execute(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> dict:
+        if (start_date or end_date) and self.has_local_index():
+            start = parse_instant(start_date)
+            end = parse_instant(end_date)
+            index = await self.index()
+            # past events and ranges beyond the cached list still go to the backend
+            if index is not None and index.covers(start, end):
+                events = index.overlapping(start, end)
+                return {"data": [replace(e, event_number=number) for number, e in enumerate(events, start=1)]}
+        return await self.cached((start_date, end_date), lambda: self.fetch(start_date, end_date))
+
+    def has_local_index(self) -> bool:
+        # range queries are answered locally only when the full list is already cached,
+        # otherwise the backend's filtered list is cheaper than fetching everything
+        cache = self.active_cache
+        if not cache or self.access_token is None:
+            return False
+        return (
+            cache.peek(self.access_token, (self.name, "index")) is not None
+            or cache.peek(self.access_token, (self.name, None, None)) is not None
+        )
+
+    async def index(self) -> Optional[EventIndex]:
+        # cached next to the lists, so mutations invalidate it together with them, but under its own
+        # TTL: building it parses every event, creates would rebuild it each time with a list TTL of 0
+        result = await self.cached(("index",), self.build_index, ttl=self.index_ttl)
+        return result.get("data")
+
+    async def build_index(self) -> dict:
+        result = await self.execute()
+        if not result or result.get("data") is None:
+            return {}
+        # taken after the fetch, the list can only be older than this
+        return {"data": EventIndex(result["data"], since=time.time())}
+
+    async def fetch(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> dict:
         try:
-            async with aiohttp.ClientSession() as session:
-                url = "http://localhost:8080/calendar/events"
+            async with self.session() as session:
+                url = self.url("/calendar/events")
                 headers = {
                     "Authorization": f"Bearer {self.access_token}",
                     "Accept": "application/json"
@@ -215,42 +314,30 @@ class ListEventsTool(Tool):
 
                 async with session.get(url, headers=headers, json=params) as response:
                     if response.status == 200:
-                        data = await response.json()
-                        events = []
-                        i = 1
-                        for item in data:
-                            events.append({
-                                "event_number": (i),
-                                "id": item.get("id"),
-                                "summary": item.get("summary", "No title"),
-                                "start_time": item.get("start_time"),
-                                "end_time": item.get("end_time"),
-                                "location": item.get("location"),
-                                "description": item.get("description")
-                            })
-                        i += 1
+                        data = await response.json(loads=loads)
+                        events = EventRecord.from_items(data)
                         return {"data": events}
                     else:
                         error_text = await response.text()
-                        print(f"Failed to get event list: {response.status} - {error_text}")
+                        logger.warning("Failed to get event list: %s - %s", response.status, error_text)
                         return {}
         except Exception as e:
-            print(f"Failed to get event list: {str(e)}")
+            logger.warning("Failed to get event list: %s", e)
             return {}
 
 @dataclass
-class ListNotesTool(Tool):
+class ListNotesTool(ListTool, Tool):
     name: str = "list_notes"
     description: str = "List existing user's notes."
-    access_token: Optional[str] = None
-
-    def set_access_token(self, token: str):
-        self.access_token = token
+    backend: str = "joplin"
 
     async def execute(self) -> dict:
+        return await self.cached((), self.fetch)
+
+    async def fetch(self) -> dict:
         try:
-            async with aiohttp.ClientSession() as session:
-                url = "http://localhost:8081/storage/notes"
+            async with self.session() as session:
+                url = self.url("/storage/notes")
                 headers = {
                     "Authorization": f"Bearer {self.access_token}",
                     "Accept": "application/json"
@@ -258,41 +345,27 @@ class ListNotesTool(Tool):
 
                 async with session.get(url, headers=headers) as response:
                     if response.status == 200:
-                        data = await response.json()
-                        notes = []
-                        for i, item in enumerate(data['data'], start=1):
-                            notes.append({
-                                "note_number": i,
-                                "id": item.get("id"),
-                                "title": item.get("title")
-                            })
+                        data = await response.json(loads=loads)
+                        notes = NoteRecord.from_items(data['data'])
                         return {"data": notes}
                     else:
                         error_text = await response.text()
-                        print(f"Failed to get note list: {response.status} - {error_text}")
+                        logger.warning("Failed to get note list: %s - %s", response.status, error_text)
                         return {}
         except Exception as e:
-            print(f"Failed to get note list: {str(e)}")
+            logger.warning("Failed to get note list: %s", e)
             return {}
 
 @dataclass
-class ListFoldersTool(Tool):
+class ListFoldersTool(ListTool, Tool):
     name: str = "list_folder"
     description: str = "List existing user's folders."
-    access_token: Optional[str] = None
-
-    def set_access_token(self, token: str):
-        self.access_token = token
+    backend: str = "joplin"
 
     def extract_folders(self, folders):
         result = []
-        for i, folder in enumerate(folders, start=1):
-            entry = {
-                "id": folder.get("id"),
-                "title": folder.get("title"),
-                "parent_id": folder.get("parent_id"),
-            }
-            result.append(entry)
+        for folder in folders:
+            result.append(FolderRecord.from_item(folder))
 
             children = folder.get("children", [])
             if children:
@@ -301,9 +374,12 @@ class ListFoldersTool(Tool):
         return result
 
     async def execute(self) -> dict:
+        return await self.cached((), self.fetch)
+
+    async def fetch(self) -> dict:
         try:
-            async with aiohttp.ClientSession() as session:
-                url = "http://localhost:8081/storage/folders"
+            async with self.session() as session:
+                url = self.url("/storage/folders")
                 headers = {
                     "Authorization": f"Bearer {self.access_token}",
                     "Accept": "application/json"
@@ -311,21 +387,22 @@ class ListFoldersTool(Tool):
 
                 async with session.get(url, headers=headers) as response:
                     if response.status == 200:
-                        data = await response.json()
+                        data = await response.json(loads=loads)
                         folders = self.extract_folders(data["data"])
                         return {"data": folders}
                     else:
                         error_text = await response.text()
-                        print(f"Failed to get folder list: {response.status} - {error_text}")
+                        logger.warning("Failed to get folder list: %s - %s", response.status, error_text)
                         return {}
         except Exception as e:
-            print(f"Failed to get folder list: {str(e)}")
+            logger.warning("Failed to get folder list: %s", e)
             return {}
 
 @dataclass
 class DeleteFolderTool(BaseTool, Tool):
     name: str = "delete_folder"
     description: str = "delete an existing folder"
+    backend: str = "joplin"
 
     async def execute(
         self,
@@ -336,13 +413,13 @@ class DeleteFolderTool(BaseTool, Tool):
         if notes:
             if title:
                 for e in notes:
-                    score1 = fuzz.partial_ratio(e.get("title", ""), title)
-                    score2 = fuzz.token_set_ratio(e.get("title", ""), title)
+                    score1 = fuzz.partial_ratio(e.title or "", title)
+                    score2 = fuzz.token_set_ratio(e.title or "", title)
                     
                     score = (score1 + score2) // 2
 
                     if score > 90:
-                        folder_id = e.get("id")
+                        folder_id = e.id
                         break
                     else :
                         folder_id = ""
@@ -351,8 +428,8 @@ class DeleteFolderTool(BaseTool, Tool):
             if not folder_id:
                 return {"data": f"there are no folder titled {title}"}
             
-            async with aiohttp.ClientSession() as session:
-                url = f"http://localhost:8081/storage/folder/delete?folder_id={folder_id}"
+            async with self.session() as session:
+                url = self.url(f"/storage/folder/delete?folder_id={folder_id}")
                 headers = {
                     "Authorization": f"Bearer {self.access_token}",
                     "Accept": "application/json",
@@ -360,6 +437,7 @@ class DeleteFolderTool(BaseTool, Tool):
                 
                 async with session.post(url, headers=headers) as response:
                     if response.status == 200:
+                        self.invalidate_cache()
                         return {"data": f"Folder deleted successfully"}
                     else:
                         error_text = await response.text()
@@ -371,6 +449,7 @@ class DeleteFolderTool(BaseTool, Tool):
 class CreateNoteTool(BaseTool, Tool):
     name: str = "create_note"
     description: str = "Create a new note"
+    backend: str = "joplin"
 
     async def execute(
         self,
@@ -388,24 +467,27 @@ class CreateNoteTool(BaseTool, Tool):
         if folders:
             if folder_name:
                 for e in folders:
-                    score1 = fuzz.partial_ratio(e.get("title", ""), folder_name)
-                    score2 = fuzz.token_set_ratio(e.get("title", ""), folder_name)
+                    score1 = fuzz.partial_ratio(e.title or "", folder_name)
+                    score2 = fuzz.token_set_ratio(e.title or "", folder_name)
                     
                     score = (score1 + score2) // 2
 
                     if score > 90:
-                        parent_id = e.get("id")
+                        parent_id = e.id
             else:
                 parent_id = ""
         else:
             parent_id = ""
 
         try:
+            if files and self.attachments:
+                files, body = await self.dedupe_attachments(files, body)
+
             data = {
                 "title": title,
                 "body": body,
                 "parent_id": parent_id,
-                "folder_tree": json.dumps(folders),
+                "folder_tree": dumps(to_plain(folders)),
             }
             form_data = aiohttp.FormData()
             form_data.add_field("title", str(data["title"]))
@@ -426,8 +508,8 @@ class CreateNoteTool(BaseTool, Tool):
                             content_type="application/octet-stream"
                         )
 
-            async with aiohttp.ClientSession() as session:
-                url = "http://localhost:8081/storage/note"
+            async with self.session() as session:
+                url = self.url("/storage/note")
                 headers = {
                     "Authorization": f"Bearer {self.access_token}",
                     "Accept": "application/json",
@@ -435,7 +517,8 @@ class CreateNoteTool(BaseTool, Tool):
 
                 async with session.post(url, headers=headers, data=form_data) as response:
                     if response.status == 200:
-                        data = await response.json()
+                        self.invalidate_cache()
+                        data = await response.json(loads=loads)
                         return {"data": f"Note created successfully"}
                     else:
                         error_text = await response.text()
@@ -443,27 +526,66 @@ class CreateNoteTool(BaseTool, Tool):
         except Exception as e:
             return {"data": f"Failed to create note: {str(e)}"}
 
+    async def dedupe_attachments(self, files: list, body: str) -> tuple[list, str]:
+        # content the user already has as a resource is linked instead of uploaded again, as long as
+        # the backend still has it, and the same content attached twice is only uploaded once
+        remaining = []
+        seen = set()
+        for file in files:
+            if not isinstance(file, dict):
+                continue
+            resource_id = self.attachments.find_resource(self.access_token, file["data"])
+            if resource_id and await self.resource_exists(resource_id):
+                body = f"{body}\n\n[{file['filename']}](:/{resource_id})"
+                continue
+            if resource_id:
+                await self.attachments.forget(self.access_token, resource_id)
+            digest = self.attachments.digest(file["data"])
+            if digest not in seen:
+                seen.add(digest)
+                remaining.append(file)
+        return remaining, body
+
+    async def resource_exists(self, resource_id: str) -> bool:
+        url = self.url(f"/storage/resource?resource_id={quote(resource_id, safe='')}")
+        headers = {
+            "Authorization": f"Bearer {self.access_token}",
+            "Accept": "application/json",
+        }
+        try:
+            async with self.session() as session:
+                # only the status matters, HEAD keeps the pooled connection reusable
+                async with session.head(url, headers=headers) as response:
+                    return response.status == 200
+        except aiohttp.ClientError:
+            return False
+
 @dataclass
 class GetNoteTool(BaseTool, Tool):
     name: str = "get_note"
     description: str = "Get an existing note"
+    backend: str = "joplin"
+    max_concurrent_downloads: int = 4
+    max_attachment_bytes: int = 25 * 1024 * 1024
+    lazy_attachments: bool = False
 
     async def execute(
         self,
-        title: str
+        title: str,
+        include_attachments: Optional[bool] = None
     ) -> dict:
         notes_result = await self.list_tool.execute()
         notes = notes_result.get("data", [])
         if notes:
             if title:
                 for e in notes:
-                    score1 = fuzz.partial_ratio(e.get("title", ""), title)
-                    score2 = fuzz.token_set_ratio(e.get("title", ""), title)
+                    score1 = fuzz.partial_ratio(e.title or "", title)
+                    score2 = fuzz.token_set_ratio(e.title or "", title)
                     
                     score = (score1 + score2) // 2
 
                     if score > 90:
-                        note_id = e.get("id")
+                        note_id = e.id
                         break
                     else :
                         note_id = ""
@@ -472,8 +594,8 @@ class GetNoteTool(BaseTool, Tool):
             if not note_id:
                 return {"data": f"there are no note titled {title}"}
             
-            async with aiohttp.ClientSession() as session:
-                url = "http://localhost:8081/storage/note/show"
+            async with self.session() as session:
+                url = self.url("/storage/note/show")
                 headers = {
                     "Authorization": f"Bearer {self.access_token}",
                     "Accept": "application/json",
@@ -485,7 +607,7 @@ class GetNoteTool(BaseTool, Tool):
                 
                 async with session.get(url, headers=headers, json=params) as response:
                     if response.status == 200:
-                        data = await response.json()
+                        data = await response.json(loads=loads)
                         note = data["data"]["note"]
                         files = data["data"]["resources"]
 
@@ -495,26 +617,13 @@ class GetNoteTool(BaseTool, Tool):
                         file_blobs = []
                        
                         if files:
-                            for file in files:
-                                resource_url = f"http://localhost:8081/storage/resource?resource_id={file.get('id')}"
-                                headers = {
-                                    "Authorization": f"Bearer {self.access_token}",
-                                    "Accept": "application/json",
-                                }
-
-                                async with aiohttp.ClientSession() as inner_session:
-                                    async with inner_session.get(resource_url, headers=headers) as resource_response:
-                                        if resource_response.status == 200:
-                                            content = await resource_response.read()
-                                            mime_type = resource_response.headers.get("Content-Type", "application/octet-stream")
-                                            filename = file.get("title")
-
-                                            file_blobs.append({
-                                                "id": file.get("id"),
-                                                "title": filename,
-                                                "mime_type": mime_type,
-                                                "blob": base64.b64encode(content).decode("utf-8"),
-                                            })
+                            if include_attachments is None:
+                                include_attachments = not self.lazy_attachments
+
+                            if include_attachments:
+                                file_blobs = await self.download_resources(session, files)
+                            else:
+                                file_blobs = [self.describe_resource(file) for file in files]
                         if file_blobs:
                             result["files"] = file_blobs
                     
@@ -525,16 +634,113 @@ class GetNoteTool(BaseTool, Tool):
         except Exception as e:
             return {"data": f"Failed to get note: {str(e)}"}
 
+    def describe_resource(self, file: dict) -> dict:
+        return {
+            "id": file.get("id"),
+            "title": file.get("title"),
+            "mime_type": file.get("mime") or "application/octet-stream",
+            "url": f"/attachments/{file.get('id')}",
+        }
+
+    def skipped_resource(self, file: dict) -> dict:
+        entry = self.describe_resource(file)
+        entry["skipped"] = "attachment size limit reached"
+        return entry
+
+    async def download_resources(self, session: aiohttp.ClientSession, files: list[dict]) -> list[dict]:
+        semaphore = asyncio.Semaphore(self.max_concurrent_downloads)
+        budget = [self.max_attachment_bytes]
+
+        async def download(file: dict) -> Optional[dict]:
+            if self.attachments:
+                cached = await self.attachments.read_base64(self.access_token, file.get("id"))
+                if cached:
+                    blob, mime_type, size = cached
+                    if size > budget[0]:
+                        return self.skipped_resource(file)
+                    budget[0] -= size
+                    return {"id": file.get("id"), "title": file.get("title"), "mime_type": mime_type, "blob": blob}
+
+            async with semaphore:
+                resource = await self.fetch_resource(session, file.get("id"), budget)
+
+            if resource is None:
+                return self.skipped_resource(file)
+            if resource is False:
+                return None
+
+            content, mime_type = resource
+            if self.attachments:
+                await self.attachments.put(self.access_token, file.get("id"), content, mime_type)
+            return {
+                "id": file.get("id"),
+                "title": file.get("title"),
+                "mime_type": mime_type,
+                "blob": base64.b64encode(content).decode("utf-8"),
+            }
+
+        results = await asyncio.gather(*(download(file) for file in files))
+        count_payload("attachment_bytes", sum(len(result.get("blob", "")) for result in results if result))
+        return [result for result in results if result]
+
+    async def get_resource(self, resource_id: str):
+        if self.attachments:
+            cached = await self.attachments.read(self.access_token, resource_id)
+            if cached:
+                content, mime_type, _ = cached
+                return content, mime_type
+
+        # returns None past the same size cap as the attachments of get_note
+        async with self.session() as session:
+            resource = await self.fetch_resource(session, resource_id, [self.max_attachment_bytes])
+        if resource and self.attachments:
+            await self.attachments.put(self.access_token, resource_id, *resource)
+        return resource
+
+    async def fetch_resource(self, session: aiohttp.ClientSession, resource_id: str, budget: Optional[list] = None):
+        # returns (content, mime_type), None when the size budget is exhausted, False when the backend fails
+        url = self.url(f"/storage/resource?resource_id={quote(resource_id, safe='')}")
+        headers = {
+            "Authorization": f"Bearer {self.access_token}",
+            "Accept": "application/json",
+        }
+
+        async with session.get(url, headers=headers) as response:
+            if response.status != 200:
+                return False
+
+            mime_type = response.headers.get("Content-Type", "application/octet-stream")
+            if budget is None:
+                return await response.read(), mime_type
+
+            if response.content_length and response.content_length > budget[0]:
+                return None
+
+            chunks = []
+            size = 0
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                size += len(chunk)
+                budget[0] -= len(chunk)
+                if budget[0] < 0:
+                    budget[0] += size
+                    return None
+                chunks.append(chunk)
+            return b"".join(chunks), mime_type
+
 @dataclass
 class UpdateNoteTool(BaseTool, Tool):
     name: str = "update_note"
     description: str = "Update an existing note"
+    backend: str = "joplin"
+    patch_support: bool = False
 
     async def execute(
         self,
         title: str,
         new_title: Optional[str] = None,
-        body: Optional[str] = None
+        body: Optional[str] = None,
+        operation: str = "replace",
+        section: Optional[str] = None
     ) -> dict:
         notes_result = await self.list_tool.execute()
         notes = notes_result.get("data", [])
@@ -542,12 +748,12 @@ class UpdateNoteTool(BaseTool, Tool):
         if notes:
             if title:
                 for e in notes:
-                    score1 = fuzz.partial_ratio(e.get("title", ""), title)
-                    score2 = fuzz.token_set_ratio(e.get("title", ""), title)
+                    score1 = fuzz.partial_ratio(e.title or "", title)
+                    score2 = fuzz.token_set_ratio(e.title or "", title)
                     
                     score = (score1 + score2) // 2
                     if score > 90:
-                        note_id = e.get("id")
+                        note_id = e.id
                         break
                     else :
                         note_id = ""
@@ -555,9 +761,11 @@ class UpdateNoteTool(BaseTool, Tool):
         try:
             if not note_id:
                 return {"data": f"there are no note titled {title}"}
+            if operation not in NOTE_OPERATIONS:
+                return {"data": f"Failed to update note: unknown operation {operation}"}
             
-            async with aiohttp.ClientSession() as session:
-                url = "http://localhost:8081/storage/note/update"
+            async with self.session() as session:
+                url = self.url("/storage/note/update")
                 headers = {
                     "Authorization": f"Bearer {self.access_token}",
                     "Accept": "application/json",
@@ -569,22 +777,65 @@ class UpdateNoteTool(BaseTool, Tool):
 
                 if new_title:
                     params.update({"title": new_title})
-                if body:
-                    params.update({"body": body})
+
+                new_body = None
+                if body and operation == "replace":
+                    new_body = body
+                elif body:
+                    if self.patch_support:
+                        status = await self.send_patch(session, headers, dict(params, operation=operation, text=body, section=section))
+                        if status == 200:
+                            return self.updated()
+                        if status not in (404, 405, 501):
+                            return {"data": f"Failed to update {status}"}
+
+                    # the edit is applied here, so the LLM only has to produce the change; the body is
+                    # fetched right before the write, a cached copy could miss edits made elsewhere
+                    current = await self.fetch_body(session, note_id)
+                    if current.get("data") is None:
+                        return {"data": "Failed to update note: could not load the current body"}
+                    new_body = apply_operation(current["data"], operation, body, section)
+
+                if new_body is not None:
+                    params.update({"body": new_body})
                 
                 async with session.post(url, headers=headers, json=params) as response:
                     if response.status == 200:
-                        return {"data": f"Note updated successfully"}
+                        return self.updated()
                     else:
                         error_text = await response.text()
                         return {"data": f"Failed to update {response.status} - {error_text}"}
+        except PatchError as e:
+            return {"data": f"Failed to update note: {str(e)}"}
         except Exception as e:
             return {"data": f"Failed to update note: {str(e)}"}
 
+    def updated(self) -> dict:
+        self.invalidate_cache()
+        return {"data": "Note updated successfully"}
+
+    async def fetch_body(self, session: aiohttp.ClientSession, note_id: str) -> dict:
+        url = self.url("/storage/note/show")
+        headers = {
+            "Authorization": f"Bearer {self.access_token}",
+            "Accept": "application/json",
+        }
+        async with session.get(url, headers=headers, json={"id": note_id}) as response:
+            if response.status != 200:
+                return {}
+            data = await response.json(loads=loads)
+            return {"data": data["data"]["note"].get("body") or ""}
+
+    async def send_patch(self, session: aiohttp.ClientSession, headers: dict, params: dict) -> int:
+        url = self.url("/storage/note/patch")
+        async with session.post(url, headers=headers, json=params) as response:
+            return response.status
+
 @dataclass
 class DeleteNoteTool(BaseTool, Tool):
     name: str = "delete_note"
     description: str = "delete an existing note"
+    backend: str = "joplin"
 
     async def execute(
         self,
@@ -595,13 +846,13 @@ class DeleteNoteTool(BaseTool, Tool):
         if notes:
             if title:
                 for e in notes:
-                    score1 = fuzz.partial_ratio(e.get("title", ""), title)
-                    score2 = fuzz.token_set_ratio(e.get("title", ""), title)
+                    score1 = fuzz.partial_ratio(e.title or "", title)
+                    score2 = fuzz.token_set_ratio(e.title or "", title)
                     
                     score = (score1 + score2) // 2
 
                     if score > 90:
-                        note_id = e.get("id")
+                        note_id = e.id
                         break
                     else :
                         note_id = ""
@@ -610,8 +861,8 @@ class DeleteNoteTool(BaseTool, Tool):
             if not note_id:
                 return {"data": f"there are no note titled {title}"}
             
-            async with aiohttp.ClientSession() as session:
-                url = f"http://localhost:8081/storage/note/delete?note_id={note_id}"
+            async with self.session() as session:
+                url = self.url(f"/storage/note/delete?note_id={note_id}")
                 headers = {
                     "Authorization": f"Bearer {self.access_token}",
                     "Accept": "application/json",
@@ -619,6 +870,7 @@ class DeleteNoteTool(BaseTool, Tool):
                 
                 async with session.post(url, headers=headers) as response:
                     if response.status == 200:
+                        self.invalidate_cache()
                         return {"data": f"Note deleted successfully"}
                     else:
                         error_text = await response.text()
@@ -626,13 +878,39 @@ class DeleteNoteTool(BaseTool, Tool):
         except Exception as e:
             return {"data": f"Failed to delete note: {str(e)}"}
         
+PREFETCH_HINTS = {
+    "list_google_calendar_events": ("calendar", "event", "meeting", "schedule", "appointment", "agenda", "acara", "jadwal", "rapat"),
+    "list_notes": ("note", "catatan"),
+    "list_folders": ("note", "folder", "catatan"),
+}
+
 class MCPService:
-    def __init__(self, host, port):
-        self.mcp = FastMCP("MCP")
+    def __init__(
+        self,
+        host,
+        port,
+        list_cache_ttl: float = 0.0,
+        event_index_ttl: float = 15.0,
+        max_concurrent_downloads: int = 4,
+        max_attachment_bytes: int = 25 * 1024 * 1024,
+        lazy_attachments: bool = False,
+        page_size: int = 100,
+        cursor_ttl: float = 300.0,
+        attachment_store: Optional[AttachmentStore] = None,
+        backends: Optional[BackendSessions] = None,
+        note_patch_support: bool = False
+    ):
+        self.mcp = None
+        self._loading = None
         self.access_token = None
-        list_event_tool = ListEventsTool()
-        list_note_tool = ListNotesTool()
-        list_folder_tool = ListFoldersTool()
+        self.list_cache = ListCache(ttl=list_cache_ttl)
+        self.http = backends or BackendSessions()
+        self.cursors = CursorStore(ttl=cursor_ttl)
+        self.page_size = page_size
+        self._prefetch_tasks = set()
+        list_event_tool = ListEventsTool(cache=self.list_cache, index_ttl=event_index_ttl)
+        list_note_tool = ListNotesTool(cache=self.list_cache)
+        list_folder_tool = ListFoldersTool(cache=self.list_cache)
         self.tools = {
             "create_google_calendar_event": CreateEventTool(list_tool=list_event_tool),
             "edit_google_calendar_event": EditEventTool(list_tool=list_event_tool),
@@ -642,13 +920,22 @@ class MCPService:
             "list_folders": list_folder_tool,
             "delete_folder": DeleteFolderTool(list_tool=list_folder_tool),
             "create_note": CreateNoteTool(list_tool=list_folder_tool),
-            "get_note": GetNoteTool(list_tool=list_note_tool),
-            "update_note": UpdateNoteTool(list_tool=list_note_tool),
+            "get_note": GetNoteTool(
+                list_tool=list_note_tool,
+                max_concurrent_downloads=max_concurrent_downloads,
+                max_attachment_bytes=max_attachment_bytes,
+                lazy_attachments=lazy_attachments
+            ),
+            "update_note": UpdateNoteTool(list_tool=list_note_tool, patch_support=note_patch_support),
             "delete_note": DeleteNoteTool(list_tool=list_note_tool)
         }
+        # every tool shares one pooled session so backend connections are kept alive across calls
+        for tool in self.tools.values():
+            tool.http = self.http
+        self.tools["get_note"].attachments = attachment_store
+        self.tools["create_note"].attachments = attachment_store
         self.host = host
         self.port = port
-        self._register_tools()
 
     def set_access_token(self, token: str):
         self.access_token = token
@@ -657,6 +944,20 @@ class MCPService:
                 tool.set_access_token(token)
 
     def _register_tools(self):
+        from fastmcp.exceptions import ToolError
+        from fastmcp.server.dependencies import get_http_headers
+
+        def request_token() -> str:
+            # every MCP call acts for the bearer token of its own HTTP request
+            auth_header = get_http_headers(include={"authorization"}).get("authorization", "")
+            if not auth_header.startswith("Bearer "):
+                raise ToolError("Missing or invalid Authorization header")
+            return auth_header[len("Bearer "):]
+
+        async def call(name: str, **kwargs) -> dict:
+            tool = await self.get_tool(name, access_token=request_token())
+            return await tool.execute(**kwargs)
+
         @self.mcp.tool()
         async def create_google_calendar_event(
             summary: str, 
@@ -665,8 +966,8 @@ class MCPService:
             location: Optional[str] = None,
             description: Optional[str] = None,
             attendees: Optional[list[str]] = None) -> dict:
-            return await self.tools["create_google_calendar_event"].execute(
-                summary=summary, start_time=start_time, end_time=end_time,
+            return await call(
+                "create_google_calendar_event", summary=summary, start_time=start_time, end_time=end_time,
                 location=location, description=description, attendees=attendees
             )
 
@@ -678,27 +979,36 @@ class MCPService:
                                              location: Optional[str] = None,
                                              description: Optional[str] = None,
                                              attendees: Optional[list[str]] = None) -> dict:
-            return await self.tools["edit_google_calendar_event"].execute(
-                prior_event_name=prior_event_name, summary=summary, start_time=start_time,
+            return await call(
+                "edit_google_calendar_event", prior_event_name=prior_event_name, summary=summary, start_time=start_time,
                 end_time=end_time, location=location, description=description, attendees= attendees
             )
 
         @self.mcp.tool()
         async def delete_google_calendar_event(summary: str) -> dict:
-            return await self.tools["delete_google_calendar_event"].execute(summary=summary)
+            return await call("delete_google_calendar_event", summary=summary)
 
         @self.mcp.tool()
         async def list_google_calendar_events(start_date: Optional[str] = None,
-                                              end_date: Optional[str] = None) -> dict:
-            return await self.tools["list_google_calendar_events"].execute(start_date=start_date, end_date=end_date)
+                                              end_date: Optional[str] = None,
+                                              limit: Optional[int] = None,
+                                              cursor: Optional[str] = None,
+                                              fields: Optional[list[str]] = None) -> dict:
+            return await self._list_page(
+                request_token(), "list_google_calendar_events", {"start_date": start_date, "end_date": end_date}, limit, cursor, fields
+            )
         
         @self.mcp.tool()
-        async def list_notes() -> dict:
-            return await self.tools["list_notes"].execute()
+        async def list_notes(limit: Optional[int] = None,
+                             cursor: Optional[str] = None,
+                             fields: Optional[list[str]] = None) -> dict:
+            return await self._list_page(request_token(), "list_notes", {}, limit, cursor, fields)
         
         @self.mcp.tool()
-        async def list_folders() -> dict:
-            return await self.tools["list_folders"].execute()
+        async def list_folders(limit: Optional[int] = None,
+                               cursor: Optional[str] = None,
+                               fields: Optional[list[str]] = None) -> dict:
+            return await self._list_page(request_token(), "list_folders", {}, limit, cursor, fields)
 
         @self.mcp.tool()
         async def create_note(
@@ -706,42 +1016,142 @@ class MCPService:
             body: str,
             folder_name: Optional[str] = None, 
             files: list = None) -> dict:
-            return await self.tools["create_note"].execute(
-                title=title, body=body, folder_name=folder_name, files=files
+            return await call(
+                "create_note", title=title, body=body, folder_name=folder_name, files=files
             )
         
         @self.mcp.tool()
         async def get_note(
-            title: str) -> dict:
-            return await self.tools["get_note"].execute(
-                title=title
+            title: str,
+            include_attachments: Optional[bool] = None) -> dict:
+            return await call(
+                "get_note", title=title, include_attachments=include_attachments
             )
         
         @self.mcp.tool()
         async def update_note(
             title: str, 
             new_title: Optional[str] = None,
-            body: Optional[str] = None) -> dict:
-            return await self.tools["update_note"].execute(
-                title=title, new_title=new_title, body=body
+            body: Optional[str] = None,
+            operation: str = "replace",
+            section: Optional[str] = None) -> dict:
+            return await call(
+                "update_note", title=title, new_title=new_title, body=body, operation=operation, section=section
             )
         
         @self.mcp.tool()
         async def delete_note(
             title: str) -> dict:
-            return await self.tools["delete_note"].execute(
-                title=title
+            return await call(
+                "delete_note", title=title
             )
         
+    async def _list_page(
+        self,
+        access_token: str,
+        name: str,
+        args: dict,
+        limit: Optional[int],
+        cursor: Optional[str],
+        fields: Optional[list[str]]
+    ) -> dict:
+        offset, snapshot_id, items = 0, None, None
+        if cursor:
+            try:
+                state = decode_cursor(cursor)
+            except InvalidCursor as e:
+                return {"data": str(e)}
+            if state.get("t") != name or state.get("a") != args:
+                return {"data": "Cursor does not belong to this listing"}
+            offset, snapshot_id = state["o"], state.get("s")
+            fields = fields or state.get("f")
+            snapshot = self.cursors.load(snapshot_id, access_token)
+            if snapshot is not None:
+                items, fields = snapshot[0], fields or snapshot[1]
+
+        if items is None:
+            # first page, the snapshot expired or another token holds the cursor: list again with
+            # this token and continue from the cursor offset
+            tool = await self.get_tool(name, access_token=access_token)
+            result = await tool.execute(**args)
+            items = result.get("data")
+            if items is None:
+                return to_plain(result)
+            snapshot_id = None
+
+        limit = limit or self.page_size
+        if limit <= 0 or (self.page_size and limit > self.page_size):
+            limit = self.page_size or len(items)
+
+        page = items[offset:offset + limit]
+        response = {"data": [project(item, fields) for item in page], "total": len(items)}
+
+        if offset + limit < len(items):
+            if snapshot_id is None:
+                snapshot_id = self.cursors.save(items, access_token, fields)
+            state = {"t": name, "a": args, "s": snapshot_id, "o": offset + limit}
+            if fields:
+                state["f"] = fields
+            response["next_cursor"] = encode_cursor(state)
+        return response
+
+    async def load(self):
+        # fastmcp is only needed by the MCP transport and takes most of the startup time to import,
+        # the server is built in a worker thread so the HTTP API can already serve meanwhile
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(asyncio.to_thread(self._build_server))
+        # shared by run() and the warm-up, a warm-up timeout must not cancel it for run()
+        await asyncio.shield(self._loading)
+
+    def _build_server(self):
+        from fastmcp import FastMCP
+
+        self.mcp = FastMCP("MCP")
+        self._register_tools()
+
     async def run(self):
+        await self.load()
         await self.mcp.run_async(transport="streamable-http", host=self.host, port=self.port, path="/mcp")
 
-    async def get_tool(self, name: str) -> Tool:
+    async def close(self):
+        await self.http.close()
+
+    async def get_tool(self, name: str, access_token: Optional[str] = None) -> Tool:
         tool = self.tools.get(name)
 
+        if access_token is not None:
+            # concurrent requests must not share one mutable token, hand out a bound copy instead
+            return self._bind(tool, access_token)
+
         if hasattr(tool, 'access_token'):
             tool.access_token = self.access_token
         return tool
 
+    def batch_scope(self):
+        return shared_scope()
+
+    def prefetch(self, query: str, access_token: str) -> list[str]:
+        # start list fetches the query will most likely need while the LLM is still planning,
+        # the tools pick the results up from the list cache (or join the in-flight fetch)
+        if self.list_cache.ttl <= 0:
+            return []
+
+        lowered = query.lower()
+        names = [
+            name for name, hints in PREFETCH_HINTS.items()
+            if any(hint in lowered for hint in hints)
+        ]
+        for name in names:
+            tool = self._bind(self.tools[name], access_token)
+            task = asyncio.create_task(tool.execute())
+            self._prefetch_tasks.add(task)
+            task.add_done_callback(self._prefetch_tasks.discard)
+        return names
+
+    def _bind(self, tool: Tool, access_token: str) -> Tool:
+        if isinstance(tool, BaseTool):
+            return replace(tool, access_token=access_token, list_tool=self._bind(tool.list_tool, access_token))
+        return replace(tool, access_token=access_token)
+
     async def get_all_tools(self) -> list[Tool]:
         return list(self.tools.values())
@@ -0,0 +1,108 @@
+import re
+from typing import Optional
+
+NOTE_OPERATIONS = ("replace", "append", "prepend", "replace_section", "diff")
+
+HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+HUNK = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class PatchError(ValueError):
+    pass
+
+
+def apply_operation(body: str, operation: str, text: str, section: Optional[str] = None) -> str:
+    if operation == "replace":
+        return text
+    if operation == "append":
+        if not body:
+            return text
+        trailing = "\n" if body.endswith("\n") else ""
+        return body.rstrip("\n") + "\n" + text.rstrip("\n") + trailing
+    if operation == "prepend":
+        return f"{text}\n{body}" if body else text
+    if operation == "replace_section":
+        if not section:
+            raise PatchError("replace_section needs a section heading")
+        return replace_section(body, section, text)
+    if operation == "diff":
+        return apply_unified_diff(body, text)
+    raise PatchError(f"unknown operation {operation}")
+
+
+def replace_section(body: str, section: str, text: str) -> str:
+    # the section runs from its heading to the next heading of the same or a higher level
+    lines = body.split("\n")
+    wanted = section.lstrip("#").strip().casefold()
+    for start, line in enumerate(lines):
+        match = HEADING.match(line)
+        if not match or match.group(2).casefold() != wanted:
+            continue
+        level = len(match.group(1))
+        end = start + 1
+        while end < len(lines):
+            following = HEADING.match(lines[end])
+            if following and len(following.group(1)) <= level:
+                break
+            end += 1
+        replacement = text.rstrip("\n").split("\n")
+        # keep a blank line before the next heading if there was one
+        if end < len(lines) and end > start + 1 and lines[end - 1] == "":
+            replacement.append("")
+        return "\n".join(lines[:start + 1] + replacement + lines[end:])
+    raise PatchError(f"section '{section}' not found")
+
+
+def apply_unified_diff(body: str, diff: str) -> str:
+    lines = body.split("\n")
+    offset = 0
+    hunks = parse_hunks(diff)
+    if not hunks:
+        raise PatchError("diff has no hunks")
+
+    for old_start, old_lines, new_lines in hunks:
+        position = find_block(lines, old_lines, max(old_start - 1 + offset, 0))
+        if position is None:
+            raise PatchError(f"hunk at line {old_start} does not apply")
+        lines[position:position + len(old_lines)] = new_lines
+        offset = position - (old_start - 1) + len(new_lines) - len(old_lines)
+    return "\n".join(lines)
+
+
+def parse_hunks(diff: str) -> list[tuple[int, list[str], list[str]]]:
+    hunks = []
+    current = None
+    for line in diff.rstrip("\n").split("\n"):
+        match = HUNK.match(line)
+        if match:
+            old_start = int(match.group(1))
+            # "-N,0" is an insertion after line N
+            if match.group(2) == "0":
+                old_start += 1
+            current = (old_start, [], [])
+            hunks.append(current)
+            continue
+        if current is None or line.startswith("\\"):
+            continue
+        line = line.rstrip("\r")
+        marker, content = line[:1], line[1:]
+        if marker == " " or line == "":
+            current[1].append(content)
+            current[2].append(content)
+        elif marker == "-":
+            current[1].append(content)
+        elif marker == "+":
+            current[2].append(content)
+    return hunks
+
+
+def find_block(lines: list[str], block: list[str], hint: int) -> Optional[int]:
+    # the stated line number first, then the nearest match around it
+    size = len(block)
+    if not size:
+        return min(hint, len(lines))
+    for distance in range(len(lines) + 1):
+        for position in (hint - distance, hint + distance):
+            if 0 <= position <= len(lines) - size and lines[position:position + size] == block:
+                return position
+    return None
@@ -0,0 +1,69 @@
+import base64
+import hashlib
+import json
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CursorStore:
+    # a snapshot belongs to the token that listed it, another token never reads it
+
+    def __init__(self, ttl: float = 300.0, max_snapshots: int = 256):
+        self.ttl = ttl
+        self.max_snapshots = max_snapshots
+        self._snapshots: OrderedDict[str, tuple[float, str, Optional[list[str]], list]] = OrderedDict()
+
+    @staticmethod
+    def owner(access_token: Optional[str]) -> str:
+        return hashlib.sha256((access_token or "").encode()).hexdigest()[:32]
+
+    def save(self, items: list, access_token: Optional[str], fields: Optional[list[str]] = None) -> str:
+        snapshot_id = uuid.uuid4().hex
+        self._snapshots[snapshot_id] = (time.monotonic() + self.ttl, self.owner(access_token), fields, items)
+        while len(self._snapshots) > self.max_snapshots:
+            self._snapshots.popitem(last=False)
+        return snapshot_id
+
+    def load(self, snapshot_id: Optional[str], access_token: Optional[str]) -> Optional[tuple[list, Optional[list[str]]]]:
+        # returns (items, fields), None when the snapshot expired or was listed by another token
+        entry = self._snapshots.get(snapshot_id) if snapshot_id else None
+        if entry is None:
+            return None
+        expires, owner, fields, items = entry
+        if time.monotonic() >= expires:
+            del self._snapshots[snapshot_id]
+            return None
+        if owner != self.owner(access_token):
+            return None
+        self._snapshots.move_to_end(snapshot_id)
+        return items, fields
+
+
+def encode_cursor(state: dict) -> str:
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {e}")
+    if not isinstance(state, dict) or not isinstance(state.get("o"), int) or state["o"] < 0:
+        raise InvalidCursor("Invalid cursor")
+    return state
+
+
+def project(item: Any, fields: Optional[list[str]]) -> dict:
+    if isinstance(item, dict):
+        names = [name for name in fields if name in item] if fields else list(item)
+        return {name: item[name] for name in names}
+    names = [name for name in fields if name in item.__slots__] if fields else item.__slots__
+    return {name: getattr(item, name) for name in names}
@@ -0,0 +1,79 @@
+from dataclasses import dataclass
+from typing import Any, Optional
+
+
+# Listed entities are kept as slotted records instead of per-item dicts: no per-instance
+# __dict__ and no repeated key strings. They only become dicts/JSON at the edges
+# (MCP responses, LLM context, backend payloads) through to_dict()/to_plain().
+
+@dataclass(slots=True)
+class EventRecord:
+    event_number: int
+    id: Optional[str]
+    summary: str
+    start_time: Optional[str]
+    end_time: Optional[str]
+    location: Optional[str]
+    description: Optional[str]
+
+    @classmethod
+    def from_items(cls, items: list[dict]) -> list["EventRecord"]:
+        return [
+            cls(
+                number,
+                item.get("id"),
+                item.get("summary", "No title"),
+                item.get("start_time"),
+                item.get("end_time"),
+                item.get("location"),
+                item.get("description"),
+            )
+            for number, item in enumerate(items, start=1)
+        ]
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+@dataclass(slots=True)
+class NoteRecord:
+    note_number: int
+    id: Optional[str]
+    title: Optional[str]
+
+    @classmethod
+    def from_items(cls, items: list[dict]) -> list["NoteRecord"]:
+        return [
+            cls(number, item.get("id"), item.get("title"))
+            for number, item in enumerate(items, start=1)
+        ]
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+@dataclass(slots=True)
+class FolderRecord:
+    id: Optional[str]
+    title: Optional[str]
+    parent_id: Optional[str]
+
+    @classmethod
+    def from_item(cls, item: dict) -> "FolderRecord":
+        return cls(item.get("id"), item.get("title"), item.get("parent_id"))
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+RECORD_TYPES = (EventRecord, NoteRecord, FolderRecord)
+
+
+def to_plain(value: Any) -> Any:
+    if isinstance(value, RECORD_TYPES):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [to_plain(item) for item in value]
+    if isinstance(value, dict):
+        return {key: to_plain(item) for key, item in value.items()}
+    return value
@@ -165,7 +165,9 @@ tool_dicts = [
                 "properties": {
                     "title": { "type": "string", "description": "Title of the note" },
                     "new_title": { "type": "string", "description": "New title of the note" },
-                    "body": { "type": "string", "description": "Addtion to the body of the note" }
+                    "body": { "type": "string", "description": "Addtion to the body of the note. For append/prepend/replace_section only the new text, for diff a unified diff against the current body" },
+                    "operation": { "type": "string", "enum": ["replace", "append", "prepend", "replace_section", "diff"], "description": "How body is applied, prefer append/prepend/replace_section/diff over rewriting the whole note with replace" },
+                    "section": { "type": "string", "description": "Heading of the section to replace when operation is replace_section" }
                 },
                 "required": ["title", "body"],
                 "additionalProperties": False
@@ -0,0 +1,94 @@
+import argparse
+import asyncio
+import json
+import time
+
+from core.use_cases import ProcessQueryUseCase
+from services.llm.llm_service import LLMClient
+from services.mcp.backend import BackendSessions
+from services.mcp.mcp_service import MCPService
+from services.replay.traffic import TrafficReplayer
+
+# Reruns a recorded query mix through ProcessQueryUseCase with the model and backends replayed:
+#   python -m services.replay.run traffic.jsonl.gz --concurrency 8 --latency-scale 1
+# The JSON report can be diffed between versions.
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 4)
+
+
+def latency_summary(values: list[float]) -> dict:
+    return {
+        "p50": percentile(values, 0.5),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": round(max(values, default=0.0), 4),
+    }
+
+
+async def replay(args) -> dict:
+    replayer = TrafficReplayer(args.recording, latency_scale=args.latency_scale)
+    mcp_service = MCPService(
+        host="127.0.0.1",
+        port=0,
+        list_cache_ttl=args.list_cache_ttl,
+        backends=BackendSessions(traffic=replayer)
+    )
+    llm_client = LLMClient(model="replay", base_url="http://replay.invalid", api_key="replay", traffic=replayer)
+    use_case = ProcessQueryUseCase(llm_service=llm_client, tool_repo=mcp_service, prefetch=args.prefetch)
+
+    queries = replayer.queries[:args.limit] if args.limit else replayer.queries
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    errors = 0
+    started = time.monotonic()
+
+    async def run(entry: dict):
+        nonlocal errors
+        if args.paced:
+            # open loop: keep the recorded arrival times
+            await asyncio.sleep(max(0.0, entry["o"] / args.speed - (time.monotonic() - started)))
+        files = [{"filename": f"file{i}", "data": bytes(size)} for i, size in enumerate(entry.get("n") or [])]
+        async with semaphore:
+            begin = time.monotonic()
+            try:
+                await use_case.execute(entry["q"], access_token=entry["a"], files=files or None)
+            except Exception:
+                errors += 1
+            latencies.append(time.monotonic() - begin)
+
+    await asyncio.gather(*(run(entry) for entry in queries))
+    elapsed = time.monotonic() - started
+    await mcp_service.close()
+
+    return {
+        "queries": len(queries),
+        "errors": errors,
+        "elapsed": round(elapsed, 3),
+        "throughput": round(len(queries) / elapsed, 3) if elapsed else None,
+        "latency": latency_summary(latencies),
+        "recorded_latency": latency_summary([entry["t"] for entry in queries]),
+        "replay": replayer.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded traffic through ProcessQueryUseCase")
+    parser.add_argument("recording")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--paced", action="store_true", help="keep the recorded arrival times")
+    parser.add_argument("--speed", type=float, default=1.0, help="arrival speed-up when paced")
+    parser.add_argument("--limit", type=int, default=0)
+    parser.add_argument("--list-cache-ttl", type=float, default=15.0)
+    parser.add_argument("--prefetch", action="store_true")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(replay(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
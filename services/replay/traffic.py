@@ -0,0 +1,426 @@
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Recordings are gzip'd JSON lines, one exchange per line:
+#   {"k": "llm", "f": fingerprint, "t": latency, "r": completion}
+#   {"k": "http", "f": fingerprint, "t": latency, "s": status, "c": content type, "l": content length,
+#    "b": body, "e": body encoding, "n": body size}
+#   {"k": "query", "a": user pseudonym, "q": query, "o": arrival offset, "t": latency, "n": file sizes}
+# Requests are only kept as fingerprints. Access tokens become pseudonyms and e-mail addresses
+# are replaced by stable placeholders. Free text (queries, completions, note bodies, event and
+# note titles, descriptions) only keeps its shape: every word is masked to its length, digits
+# and punctuation stay. Binary bodies aren't kept, only their size. Fingerprints are taken over
+# the same masking, so a replay built from the masked data fingerprints the same.
+
+EMAIL = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+WORD = re.compile(r"\b[^\W\d_]+\b")
+PSEUDONYM = re.compile(r"u[0-9a-f]{12}")
+TIMESTAMP = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:\d{2})?")
+REDACTED_FIELDS = frozenset({
+    "query", "content", "title", "new_title", "body", "summary", "description", "location",
+    "prior_event_name", "folder_name", "section", "attendees",
+})
+
+
+class ReplayMiss(ConnectionError):
+    pass
+
+
+def pseudonym(access_token: Optional[str]) -> str:
+    if not access_token:
+        return "anonymous"
+    # replays run under the recorded pseudonyms, those map to themselves
+    if PSEUDONYM.fullmatch(access_token):
+        return access_token
+    return "u" + hashlib.sha256(access_token.encode()).hexdigest()[:12]
+
+
+def anonymize_email(match: re.Match) -> str:
+    email = match.group()
+    if email.endswith("@example.invalid"):
+        return email
+    return f"user-{hashlib.sha256(email.encode()).hexdigest()[:8]}@example.invalid"
+
+
+def mask_words(text: str) -> str:
+    return WORD.sub(lambda match: "x" * len(match.group()), text)
+
+
+def redact(text: str) -> str:
+    # e-mail placeholders are kept whole, redacting twice gives the same text
+    parts, last = [], 0
+    for match in EMAIL.finditer(text):
+        parts.append(mask_words(text[last:match.start()]))
+        parts.append(anonymize_email(match))
+        last = match.end()
+    parts.append(mask_words(text[last:]))
+    return "".join(parts)
+
+
+def anonymize(value: Any, redacted: bool = False) -> Any:
+    if isinstance(value, str):
+        return redact(value) if redacted else EMAIL.sub(anonymize_email, value)
+    if isinstance(value, (list, tuple)):
+        return [anonymize(item, redacted) for item in value]
+    if isinstance(value, dict):
+        return {key: anonymize_field(key, item, redacted) for key, item in value.items()}
+    return value
+
+
+def anonymize_field(key: str, value: Any, redacted: bool) -> Any:
+    if key == "arguments" and isinstance(value, str):
+        # tool call arguments are a JSON string, their fields are redacted like any other
+        try:
+            return json.dumps(anonymize(json.loads(value), redacted), separators=(",", ":"))
+        except ValueError:
+            pass
+    return anonymize(value, redacted or key in REDACTED_FIELDS)
+
+
+def anonymize_text(body: bytes, content_type: str) -> str:
+    if content_type.startswith("application/json") and body:
+        try:
+            return json.dumps(anonymize(json.loads(body)), separators=(",", ":"))
+        except ValueError:
+            pass
+    return redact(body.decode("utf-8", errors="replace"))
+
+
+def fingerprint(*parts: Any) -> str:
+    raw = json.dumps(anonymize(parts, redacted=True), sort_keys=True, separators=(",", ":"), default=str)
+    # the prompts carry the current time, which never matches between a recording and its replay
+    return hashlib.sha256(TIMESTAMP.sub("<time>", raw).encode()).hexdigest()[:24]
+
+
+def llm_fingerprint(stage: str, kwargs: dict) -> str:
+    # system prompts and tool schemas are left out so a recording stays replayable across prompt edits
+    messages = [message for message in kwargs.get("messages", []) if message.get("role") != "system"]
+    return fingerprint("llm", stage, messages)
+
+
+def http_fingerprint(backend: str, method: str, url: str, access_token: Optional[str], kwargs: dict) -> str:
+    parts = urlsplit(url)
+    body = kwargs.get("json")
+    if body is None and kwargs.get("data") is not None:
+        body = "<form>"
+    return fingerprint("http", backend, method, parts.path, parts.query, pseudonym(access_token), body)
+
+
+def bearer(headers: Optional[dict]) -> Optional[str]:
+    auth = (headers or {}).get("Authorization", "")
+    return auth.split("Bearer ", 1)[1] if auth.startswith("Bearer ") else None
+
+
+class RecordedContent:
+    def __init__(self, body: bytes):
+        self.body = body
+
+    async def iter_chunked(self, size: int):
+        for start in range(0, len(self.body), size):
+            yield self.body[start:start + size]
+
+    async def read(self) -> bytes:
+        return self.body
+
+
+class RecordedResponse:
+    # the subset of aiohttp.ClientResponse the tools use
+    def __init__(self, status: int, content_type: str, body: bytes, content_length: Optional[int] = None):
+        self.status = status
+        self.headers = {"Content-Type": content_type}
+        self.content_length = content_length
+        self.content = RecordedContent(body)
+        self.body = body
+
+    async def read(self) -> bytes:
+        return self.body
+
+    async def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+    async def json(self, loads=json.loads, **kwargs) -> Any:
+        return loads(self.body)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class TrafficRecorder:
+    offline = False
+
+    def __init__(self, path: str, flush_every: int = 64):
+        self.path = path
+        self.flush_every = flush_every
+        self.recorded = defaultdict(int)
+        self.started = time.monotonic()
+        self._pending: list[str] = []
+        self._lock = threading.Lock()
+        self._flushes: set[asyncio.Task] = set()
+
+    def record(self, entry: dict):
+        self.recorded[entry["k"]] += 1
+        self._pending.append(json.dumps(entry, separators=(",", ":")))
+        if len(self._pending) >= self.flush_every:
+            lines, self._pending = self._pending, []
+            # compressing and writing happens off the loop
+            task = asyncio.create_task(asyncio.to_thread(self._write, lines))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    def _write(self, lines: list[str]):
+        with self._lock, gzip.open(self.path, "at", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+
+    async def close(self):
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        if self._pending:
+            lines, self._pending = self._pending, []
+            await asyncio.to_thread(self._write, lines)
+
+    def record_query(self, query: str, access_token: Optional[str], files: Optional[list[dict]], started: float, latency: float):
+        self.record({
+            "k": "query",
+            "a": pseudonym(access_token),
+            "q": redact(query),
+            "o": round(started - self.started, 4),
+            "t": round(latency, 4),
+            "n": [len(file.get("data") or b"") for file in files or []],
+        })
+
+    def wrap_pool(self, pool):
+        return RecordingPool(pool, self)
+
+    def wrap_session(self, backend: str, session):
+        return RecordingSession(backend, session, self)
+
+    def stats(self) -> dict:
+        return {"mode": "record", "path": self.path, "recorded": dict(self.recorded)}
+
+
+class RecordingPool:
+    def __init__(self, pool, recorder: TrafficRecorder):
+        self.pool = pool
+        self.recorder = recorder
+
+    async def create(self, stage: str = "default", **kwargs):
+        started = time.monotonic()
+        response = await self.pool.create(stage, **kwargs)
+        self.recorder.record({
+            "k": "llm",
+            "f": llm_fingerprint(stage, kwargs),
+            "t": round(time.monotonic() - started, 4),
+            "r": anonymize(response.model_dump(mode="json")),
+        })
+        return response
+
+    async def warm(self):
+        await self.pool.warm()
+
+    def stats(self) -> dict:
+        return self.pool.stats()
+
+
+class RecordingSession:
+    def __init__(self, backend: str, session, recorder: TrafficRecorder):
+        self.backend = backend
+        self.session = session
+        self.recorder = recorder
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def head(self, url: str, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str, **kwargs):
+        started = time.monotonic()
+        async with self.session.request(method, url, **kwargs) as response:
+            # only what the tool reads is recorded, a streamed read it stops early stays capped
+            recording = RecordingResponse(response)
+            yield recording
+            latency = time.monotonic() - started
+
+        body = recording.body
+        content_type = response.headers.get("Content-Type", "application/octet-stream")
+        entry = {
+            "k": "http",
+            "f": http_fingerprint(self.backend, method, url, bearer(kwargs.get("headers")), kwargs),
+            "t": round(latency, 4),
+            "s": response.status,
+            "c": content_type,
+            "l": response.content_length,
+            "n": len(body),
+        }
+        if content_type.startswith(("application/json", "text/")):
+            entry["b"] = anonymize_text(body, content_type)
+            entry["e"] = "utf-8"
+        else:
+            entry["b"] = ""
+            entry["e"] = "omitted"
+        self.recorder.record(entry)
+
+
+class RecordingContent:
+    def __init__(self, recording: "RecordingResponse"):
+        self.recording = recording
+
+    async def iter_chunked(self, size: int):
+        async for chunk in self.recording.response.content.iter_chunked(size):
+            self.recording.chunks.append(chunk)
+            yield chunk
+
+    async def read(self) -> bytes:
+        return await self.recording.read()
+
+
+class RecordingResponse:
+    # passes the live response through and keeps the bytes read from it
+    def __init__(self, response):
+        self.response = response
+        self.status = response.status
+        self.headers = response.headers
+        self.content_length = response.content_length
+        self.content = RecordingContent(self)
+        self.chunks: list[bytes] = []
+
+    @property
+    def body(self) -> bytes:
+        return b"".join(self.chunks)
+
+    async def read(self) -> bytes:
+        if not self.chunks:
+            self.chunks.append(await self.response.read())
+        return self.body
+
+    async def text(self) -> str:
+        return (await self.read()).decode("utf-8", errors="replace")
+
+    async def json(self, loads=json.loads, **kwargs) -> Any:
+        return loads(await self.read())
+
+
+class TrafficReplayer:
+    # nothing is sent to the model or the backends while replaying
+    offline = True
+
+    def __init__(self, path: str, latency_scale: float = 1.0):
+        self.path = path
+        self.latency_scale = latency_scale
+        self.queries: list[dict] = []
+        self.served = defaultdict(int)
+        self.misses = defaultdict(int)
+        self._exchanges: dict[tuple[str, str], deque] = defaultdict(deque)
+        self._load()
+
+    def _load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry["k"] == "query":
+                    self.queries.append(entry)
+                else:
+                    self._exchanges[(entry["k"], entry["f"])].append(entry)
+        self.queries.sort(key=lambda entry: entry["o"])
+
+    async def take(self, kind: str, key: str) -> dict:
+        exchanges = self._exchanges.get((kind, key))
+        if not exchanges:
+            self.misses[kind] += 1
+            logger.debug("replay miss for %s exchange %s", kind, key)
+            raise ReplayMiss(f"no recorded {kind} exchange for {key}")
+        # identical requests are served in recorded order, the last one repeats once they run out
+        entry = exchanges.popleft() if len(exchanges) > 1 else exchanges[0]
+        self.served[kind] += 1
+        if self.latency_scale > 0:
+            await asyncio.sleep(entry["t"] * self.latency_scale)
+        return entry
+
+    def wrap_pool(self, pool=None):
+        return ReplayPool(self)
+
+    def wrap_session(self, backend: str, session=None):
+        return ReplaySession(backend, self)
+
+    def stats(self) -> dict:
+        return {
+            "mode": "replay",
+            "path": self.path,
+            "served": dict(self.served),
+            "misses": dict(self.misses),
+        }
+
+
+class ReplayPool:
+    def __init__(self, replayer: TrafficReplayer):
+        self.replayer = replayer
+
+    async def create(self, stage: str = "default", **kwargs):
+        from openai.types.chat import ChatCompletion
+
+        entry = await self.replayer.take("llm", llm_fingerprint(stage, kwargs))
+        return ChatCompletion.model_validate(entry["r"])
+
+    def stats(self) -> dict:
+        return self.replayer.stats()
+
+
+class ReplaySession:
+    def __init__(self, backend: str, replayer: TrafficReplayer):
+        self.backend = backend
+        self.replayer = replayer
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def head(self, url: str, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str, **kwargs):
+        key = http_fingerprint(self.backend, method, url, bearer(kwargs.get("headers")), kwargs)
+        entry = await self.replayer.take("http", key)
+        if entry["e"] == "omitted":
+            body = bytes(entry["n"])
+        elif entry["e"] == "base64":
+            body = base64.b64decode(entry["b"])
+        else:
+            body = entry["b"].encode()
+        yield RecordedResponse(entry["s"], entry["c"], body, entry.get("l", len(body)))
+
+
+def open_traffic(mode: Optional[str], path: Optional[str], latency_scale: float = 1.0):
+    if not mode or mode == "off":
+        return None
+    if not path:
+        raise ValueError("TRAFFIC_FILE is required when TRAFFIC_MODE is set")
+    if mode == "record":
+        return TrafficRecorder(path)
+    if mode == "replay":
+        return TrafficReplayer(path, latency_scale=latency_scale)
+    raise ValueError(f"unknown TRAFFIC_MODE {mode}")